@@ -1,5 +1,6 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, send_from_directory, jsonify
+from flask import Flask, Request, render_template, request, redirect, url_for, send_file, jsonify, Response
+from werkzeug.security import safe_join
 import subprocess
 import uuid
 import glob
@@ -7,13 +8,38 @@ from PIL import Image # Import Pillow for resizing
 import shutil
 import zipfile # Added for zipping frames
 import time
-from PIL import ImageFilter, ImageChops
+import numpy as np # Binary morphology for the post-process outline
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import queue
+import json
+import atexit
+import tempfile
+import hashlib
+import math
+import re
 
 app = Flask(__name__)
-UPLOAD_FOLDER = 'uploads'
+# Uploads, cached scenes, per-angle frames, sheets and previews are throwaway intermediates.
+# Keep them on tmpfs (/dev/shm) when available so only the final zips in OUTPUT_FOLDER hit persistent disk.
+# Override with the SCRATCH_DIR environment variable.
+SCRATCH_DIR = os.environ.get("SCRATCH_DIR") or os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'fbxtosprite')
+# Uploads that don't fit in SCRATCH_DIR (e.g. Docker's 64 MB /dev/shm) are processed here, on disk, instead
+DISK_SCRATCH_DIR = os.path.join(tempfile.gettempdir(), 'fbxtosprite')
+# Free space a job needs in scratch beyond its upload: the prepared .blend, rendered frames and sheets
+SCRATCH_RESERVE_BYTES = 256 * 1024 * 1024
+# Previews and prepared scenes left behind (a preview nobody fetched, a worker killed mid-job) are deleted
+# this long after they were written, swept whenever a job or preview starts
+SCRATCH_FILE_TTL = 60 * 60 # Seconds
+# Finished zips in OUTPUT_FOLDER double as a render cache (see render_cache_key). Zips unused for
+# OUTPUT_CACHE_MAX_AGE are deleted, and the least recently used ones go once the folder passes OUTPUT_CACHE_MAX_BYTES.
+OUTPUT_CACHE_MAX_AGE = 7 * 24 * 60 * 60 # Seconds
+OUTPUT_CACHE_MAX_BYTES = int(os.environ.get("OUTPUT_CACHE_MAX_BYTES") or 5 * 1024 ** 3)
+UPLOAD_FOLDER = os.path.join(SCRATCH_DIR, 'uploads')
 OUTPUT_FOLDER = 'output'
 ALLOWED_EXTENSIONS = {'fbx'}
-PREVIEW_FOLDER = os.path.join('output', 'previews')
+PREVIEW_FOLDER = os.path.join(SCRATCH_DIR, 'previews')
 
 # IMPORTANT: Configure Blender path if not in system PATH
 # Examples:
@@ -21,149 +47,303 @@ PREVIEW_FOLDER = os.path.join('output', 'previews')
 # blender_executable = "/usr/bin/blender" # Example Linux path
 # blender_executable = "/Applications/Blender.app/Contents/MacOS/Blender" # Example macOS path
 blender_executable = "C:/Program Files/Blender Foundation/Blender 4.3/blender.exe" # Use blender.exe, not launcher
+# Resolved once at startup so requests can fail fast instead of saving the upload and failing inside the render
+BLENDER_OK = os.path.isfile(blender_executable) or shutil.which(blender_executable) is not None
 
+# Angles are rendered by independent Blender processes; cap concurrency at half the cores to avoid CPU/GPU thrash
+MAX_PARALLEL_RENDERS = max(1, (os.cpu_count() or 2) // 2)
+
+# Previews are uniquely named per render, so browsers may cache them for a year
+PREVIEW_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Styles accepted by /upload (anything else falls back to 'bright'), and the low-res pixel styles among them
+VALID_STYLES = frozenset({'bright', 'cel', 'unlit', 'original_unlit', 'wireframe', 'clay', 'pixel_cel', 'cel_outline',
+                          'cel_thicker_outline', 'pixel_outline', 'pixel_post_outline', 'pixel_post_thin_outline'})
+PIXEL_STYLES = frozenset({'pixel_cel', 'pixel_outline', 'pixel_post_outline', 'pixel_post_thin_outline'})
+
+# Pixel styles render at pixel_resolution and Blender upscales them (Nearest Neighbor) to this size before writing
+PIXEL_UPSCALE_RESOLUTION = 1024
+
+# Re-saving outlined WebP frames: lossless keeps the hard pixel edges, method 0 is libwebp's fastest effort level
+WEBP_FRAME_SAVE_KWARGS = {'lossless': True, 'method': 0}
+# ...and PNG frames at zlib level 1, the same level Blender's default 15% PNG compression writes them with
+# (they go into a ZIP_STORED archive as-is, so level 6 only costs encode time)
+PNG_FRAME_SAVE_KWARGS = {'compress_level': 1}
+
+# Background job queues for /upload. Pixel styles get their own queue so their upscaling/outlining
+# doesn't starve light renders. JOBS maps job_id -> {'state': PENDING|STARTED|SUCCESS|FAILURE, ...}
+RENDER_JOB_QUEUE = ThreadPoolExecutor(max_workers=1, thread_name_prefix='render-job')
+PIXEL_JOB_QUEUE = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pixel-job')
+JOBS = {}
+JOBS_LOCK = threading.Lock()
+# Finished (SUCCESS/FAILURE) job records are dropped this long after they finish, swept whenever a job is added.
+# The client stops polling once it sees a final state, so this only has to outlast one poll.
+JOB_RECORD_TTL = 60 * 60 # Seconds
+# Temp file/dir deletion for finished jobs, so a job's status doesn't wait on unlinking its frames
+CLEANUP_QUEUE = ThreadPoolExecutor(max_workers=2, thread_name_prefix='cleanup')
+
+# Persistent Blender processes (scripts/blender_worker.py) that take render jobs over stdin,
+# so each angle doesn't pay Blender's startup + FBX importer load again
+BLENDER_WORKER_SCRIPT = os.path.join("scripts", "blender_worker.py")
+BLENDER_WORKER_DONE_MARKER = "BLENDER_WORKER_DONE" # Must match DONE_MARKER in blender_worker.py
+BLENDER_JOB_TIMEOUT = 300 # Seconds per angle, same limit as the old one-shot subprocess.run
+# Upper bound on live Blender processes: each of the two job queues renders on up to MAX_PARALLEL_RENDERS
+# workers, plus one for previews. Callers past this wait for a worker instead of starting another process.
+MAX_BLENDER_WORKERS = 2 * MAX_PARALLEL_RENDERS + 1
+
+app.config['SCRATCH_FOLDER'] = SCRATCH_DIR
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['OUTPUT_FOLDER'] = OUTPUT_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024 # Increased limit to 100 MB
+# Let the front-end web server stream final zips instead of tying up a Flask worker for the whole download.
+# nginx: set ACCEL_REDIRECT_PREFIX to an `internal` location aliased to OUTPUT_FOLDER (e.g. /_protected_output/).
+# Apache (mod_xsendfile): set USE_X_SENDFILE=1 (Flask's send_file then emits X-Sendfile).
+app.config['ACCEL_REDIRECT_PREFIX'] = os.environ.get("ACCEL_REDIRECT_PREFIX")
+app.config['USE_X_SENDFILE'] = os.environ.get("USE_X_SENDFILE") == "1"
 app.config['PREVIEW_FOLDER'] = PREVIEW_FOLDER
 
-# Ensure upload and output directories exist
+# Ensure scratch, upload and output directories exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 os.makedirs(PREVIEW_FOLDER, exist_ok=True)
 
+# --- Upload Spooling ---
+def scratch_dir_for(upload_bytes):
+    """SCRATCH_DIR if it has room for an upload of upload_bytes plus SCRATCH_RESERVE_BYTES, else DISK_SCRATCH_DIR."""
+    scratch_dir = app.config['SCRATCH_FOLDER']
+    try:
+        free_bytes = shutil.disk_usage(scratch_dir).free
+    except OSError:
+        free_bytes = 0
+    if free_bytes < (upload_bytes or 0) + SCRATCH_RESERVE_BYTES:
+        print(f"DEBUG: Only {free_bytes // (1024 * 1024)} MB free in {scratch_dir}, using {DISK_SCRATCH_DIR} for this upload")
+        scratch_dir = DISK_SCRATCH_DIR
+    os.makedirs(os.path.join(scratch_dir, 'uploads'), exist_ok=True)
+    return scratch_dir
+
+class HashingSpoolFile:
+    """Spooled upload file that SHA-256s the bytes as Werkzeug writes them, so the render cache key
+    doesn't need a second pass over the upload. Everything else is passed through to the temp file."""
+    def __init__(self, file):
+        self.file = file
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def __iter__(self):
+        return iter(self.file)
+
+class ScratchUploadRequest(Request):
+    """Spools uploaded files straight into the scratch uploads dir so save_upload can hardlink instead of copying.
+    The scratch root picked for the upload (see scratch_dir_for) is kept as request.scratch_dir."""
+    scratch_dir = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.scratch_dir is None:
+            self.scratch_dir = scratch_dir_for(total_content_length)
+        # Named so it can be linked; removed automatically when Werkzeug closes the stream after the request
+        return HashingSpoolFile(tempfile.NamedTemporaryFile('wb+', dir=os.path.join(self.scratch_dir, 'uploads'),
+                                                            prefix='incoming_'))
+
+app.request_class = ScratchUploadRequest
+
+def save_upload(file_storage, dest_path):
+    """Puts an uploaded file at dest_path: a hardlink to the spooled temp file when possible, else a 1 MiB-buffered copy."""
+    stream = file_storage.stream
+    spooled_path = getattr(stream, 'name', None)
+    if isinstance(spooled_path, str):
+        try:
+            stream.flush()
+            os.link(spooled_path, dest_path)
+            return
+        except OSError as e:
+            print(f"DEBUG: Could not hardlink upload ({e}), copying instead")
+    stream.seek(0)
+    file_storage.save(dest_path, buffer_size=1024 * 1024)
+
+def file_sha256(file_storage):
+    """SHA-256 of an uploaded file: taken from the spool file when it was hashed while uploading, else read back."""
+    spool_digest = getattr(file_storage.stream, 'sha256', None)
+    if spool_digest is not None:
+        return spool_digest.digest()
+    digest = hashlib.sha256()
+    file_storage.stream.seek(0)
+    for chunk in iter(lambda: file_storage.stream.read(1024 * 1024), b''):
+        digest.update(chunk)
+    return digest.digest()
+
+def _render_code_version():
+    """Hash of the code that decides what a render looks like, so zips made by older code are never reused."""
+    digest = hashlib.sha256()
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    for path in ("app.py", os.path.join("scripts", "process_fbx.py"), os.path.join("scripts", "blender_worker.py")):
+        with open(os.path.join(app_dir, path), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+RENDER_CODE_VERSION = _render_code_version()
+
+def render_cache_key(file_digest, params):
+    """Content key for a render: SHA-256 over the upload's digest, RENDER_CODE_VERSION and the canonical JSON of
+    its render params. The same model rendered with the same settings and code gets the same key, so its
+    finished zip can be reused."""
+    digest = hashlib.sha256(file_digest)
+    digest.update(RENDER_CODE_VERSION.encode())
+    digest.update(json.dumps(params, sort_keys=True).encode())
+    return digest.hexdigest()[:32]
+# --- End Upload Spooling ---
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def iter_files(base_dir, file_extension=None):
+    """Yields file paths under base_dir recursively (optionally only those ending in .file_extension).
+    Uses os.scandir so file types come from the directory listing instead of extra stat calls."""
+    suffix = f".{file_extension.lower()}" if file_extension else None
+    with os.scandir(base_dir) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from iter_files(entry.path, file_extension)
+            elif entry.is_file() and (suffix is None or entry.name.lower().endswith(suffix)):
+                yield entry.path
+
+def scan_files(folder, prefix='', suffixes=()):
+    """Sorted paths of files directly in folder whose names start with prefix and end with one of suffixes.
+    One scandir pass; DirEntry carries the file type so there's no extra stat per match like glob."""
+    with os.scandir(folder) as entries:
+        return sorted(e.path for e in entries
+                      if e.name.startswith(prefix) and (not suffixes or e.name.endswith(suffixes)) and e.is_file())
+
+def natural_sort_key(path):
+    """Sort key comparing the digit runs in a file name as numbers, so angle_45_0 sorts before angle_135_0
+    and frame _0010 after _0009."""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', os.path.basename(path))]
+
+def zip_write_stored(zipf, file_path, arcname):
+    """Adds file_path to zipf uncompressed using a single read and a single write.
+    ZipFile.write streams through 8 KiB copyfileobj chunks; frames are small, so one buffer is cheaper."""
+    zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+    zinfo.compress_type = zipfile.ZIP_STORED
+    with open(file_path, 'rb') as src:
+        zipf.writestr(zinfo, src.read())
+
 def zip_output_directory(base_dir, output_zip_path, file_extension):
     """Recursively zips the contents of the base_dir matching the extension."""
     if not os.path.isdir(base_dir):
         print(f"Error: Base directory for zipping not found: {base_dir}")
         return False
-    
-    search_pattern = f"*.{file_extension.lower()}" # Ensure lowercase extension
-    all_files_found = glob.glob(os.path.join(base_dir, '**', search_pattern), recursive=True)
-    if not all_files_found:
-        print(f"Error: No {search_pattern} files found recursively in {base_dir} to zip.")
-        return False
 
+    files_written = 0
     try:
-        with zipfile.ZipFile(output_zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, _, files in os.walk(base_dir):
-                for file in files:
-                    if file.lower().endswith(f".{file_extension.lower()}"):
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.relpath(file_path, base_dir)
-                        zipf.write(file_path, arcname=arcname)
-            print(f"Successfully created zip file: {output_zip_path} from {base_dir}")
-        return True
+        # PNG/WebP frames are already compressed; re-DEFLATEing them burns CPU for no size gain
+        with zipfile.ZipFile(output_zip_path, 'w', zipfile.ZIP_STORED) as zipf:
+            for file_path in iter_files(base_dir, file_extension):
+                arcname = os.path.relpath(file_path, base_dir)
+                zip_write_stored(zipf, file_path, arcname)
+                files_written += 1
     except Exception as e:
         print(f"Error creating zip file: {e}")
         return False
-    finally:
-        # Cleanup happens in the main function after zipping
-        pass 
-
-# --- NEW Upscaling Function ---
-def upscale_pixelated_frames(frame_folder_path, target_resolution=1024):
-    """Finds PNGs/WebPs, upscales them using Nearest Neighbor, and overwrites them."""
-    print(f"DEBUG: Upscaling frames in {frame_folder_path} to {target_resolution}x{target_resolution}...")
-    found_frames = 0
-    # Support both PNG and WebP for upscaling
-    patterns_to_try = ['*.png', '*.webp']
-    processed_files = set()
-    
-    for pattern in patterns_to_try:
-        try:
-            frame_files = glob.glob(os.path.join(frame_folder_path, pattern))
-            if not frame_files:
-                continue # Try next pattern
-                
-            for f_path in frame_files:
-                if f_path in processed_files: continue # Avoid processing twice if somehow matched both
-                try:
-                    with Image.open(f_path) as img:
-                        # Convert Paletted images (like some PNGs) to RGBA before resizing
-                        if img.mode == 'P':
-                            img = img.convert('RGBA')
-                            print(f"DEBUG: Converted paletted image {os.path.basename(f_path)} to RGBA.")
-                        # Use Image.Resampling.NEAREST for Pillow 9.1.0+
-                        img_resized = img.resize((target_resolution, target_resolution), Image.Resampling.NEAREST)
-                        # Save back to the original path, overwriting the low-res version
-                        # Ensure quality for WebP if needed
-                        save_kwargs = {}
-                        if f_path.lower().endswith('.webp'):
-                            save_kwargs['quality'] = 100 # Use high quality for potentially lossless
-                            save_kwargs['lossless'] = True
-                            
-                        img_resized.save(f_path, **save_kwargs)
-                        processed_files.add(f_path)
-                        found_frames += 1
-                except Exception as e_img:
-                     print(f"Warning: Failed to upscale image {f_path}: {e_img}")
-                     # Continue attempting other images
-                     
-        except Exception as e_glob:
-             print(f"Error during frame upscaling glob/loop for {pattern}: {e_glob}")
-             # Continue to next pattern
-             
-    print(f"DEBUG: Finished Upscaling. Processed {found_frames} frames in {frame_folder_path}.")
-    return found_frames > 0 # Return True if at least one frame was processed
-# --- End Upscaling Function ---
+
+    if not files_written:
+        # Single pass means emptiness is only known afterwards; don't leave an empty archive behind
+        print(f"Error: No *.{file_extension.lower()} files found recursively in {base_dir} to zip.")
+        try: os.remove(output_zip_path)
+        except OSError as e_rem: print(f"Warning: Could not remove empty zip file {output_zip_path}: {e_rem}")
+        return False
+    print(f"Successfully created zip file: {output_zip_path} from {base_dir}")
+    return True
 
 # --- Sprite Sheet Creation Function (Re-added and adapted) ---
-def create_sprite_sheet(frame_folder, output_sheet_path, base_name, input_file_extension, output_sheet_format):
-    """Creates a horizontal sprite sheet from individual frames, saving in the specified format."""
-    frame_pattern = os.path.join(frame_folder, f"{base_name}_*.{input_file_extension.lower()}")
-    print(f"DEBUG (create_sprite_sheet): Glob pattern: {frame_pattern}") # Added Debug
-    frame_files = sorted(glob.glob(frame_pattern))
+def create_sprite_sheet(frame_folder, output_sheet_path, base_name, input_file_extension, output_sheet_format, frame_map_path=None,
+                        lossless=False):
+    """Creates a sprite sheet from individual frames (named base_name_*.ext), saving in the specified format
+    (WebP sheets are lossless if requested, e.g. for pixel art whose hard edges lossy WebP would smear).
+    Frames are placed in numeric angle order, then frame order.
+    Each animation (frames sharing a name up to their _NNNN index, i.e. one angle) fills one row, so a
+    single-angle sheet is a horizontal strip and a multi-angle sheet is a grid; when every animation is a
+    single frame (auto angles) the frames are wrapped into a near-square grid instead. If frame_map_path is given,
+    a JSON map of {frame name: [x, y, w, h]} is written there so the frames can be addressed in the sheet."""
+    frame_prefix, frame_suffix = f"{base_name}_", f".{input_file_extension.lower()}"
+    print(f"DEBUG (create_sprite_sheet): Frame pattern: {frame_prefix}*{frame_suffix} in {frame_folder}") # Added Debug
+    # In angle order, then frame order (numerically: a plain string sort puts angle_135 before angle_45)
+    frame_files = sorted(scan_files(frame_folder, frame_prefix, (frame_suffix,)), key=natural_sort_key)
     print(f"DEBUG (create_sprite_sheet): Found files: {frame_files}") # Added Debug
 
     if not frame_files:
         print(f"ERROR (create_sprite_sheet): No frame files found matching pattern.") # Added ERROR
         return False
 
-    images = [] 
     try:
         print(f"DEBUG (create_sprite_sheet): Loading {len(frame_files)} image files...") # Added Debug
-        for idx, f in enumerate(frame_files):
-            try:
-                img = Image.open(f)
-                images.append(img)
-                # print(f"DEBUG (create_sprite_sheet): Loaded frame {idx+1}: {f}") # Can be too verbose
-            except Exception as e_open:
-                print(f"ERROR (create_sprite_sheet): Failed to open image file {f}: {e_open}") # Added ERROR
-                # Close any already opened images before failing
-                for opened_img in images: opened_img.close()
-                return False # Fail if any image can't be opened
-                
-        if not images:
-             print("ERROR (create_sprite_sheet): Image list is empty after loading attempts.") # Added ERROR
-             return False
+        # Assuming all frames have the same dimensions (pixel styles arrive already upscaled from Blender);
+        # Image.open only reads the header, so this doesn't decode the first frame twice
+        try:
+            with Image.open(frame_files[0]) as first_img:
+                width, height = first_img.size
+        except Exception as e_open:
+            print(f"ERROR (create_sprite_sheet): Failed to open image file {frame_files[0]}: {e_open}") # Added ERROR
+            return False
 
-        # Assuming all frames have the same dimensions (after potential upscale)
-        width, height = images[0].size
-        total_width = width * len(images)
+        # Grid cell (row, column) per frame: frame files are sorted, so each animation's frames are contiguous
+        frame_names = [os.path.splitext(os.path.basename(f))[0] for f in frame_files]
+        rows = {}
+        for idx, name in enumerate(frame_names):
+            rows.setdefault(name.rsplit('_', 1)[0], []).append(idx)
+        cells = [None] * len(frame_files)
+        if len(rows) > 1 and all(len(indices) == 1 for indices in rows.values()):
+            # One frame per animation (auto-angle renders): a row each would be a one-column strip, so wrap
+            # them into a near-square grid of ceil(sqrt(n)) columns instead
+            num_columns = math.ceil(math.sqrt(len(frame_files)))
+            cells = [divmod(idx, num_columns) for idx in range(len(frame_files))]
+            num_rows = math.ceil(len(frame_files) / num_columns)
+        else:
+            for row, indices in enumerate(rows.values()):
+                for col, idx in enumerate(indices):
+                    cells[idx] = (row, col)
+            num_columns = max(len(indices) for indices in rows.values())
+            num_rows = len(rows)
+        total_width, total_height = width * num_columns, height * num_rows
+
+        # Frames sit side by side without overlapping, so each one is a straight copy into its cell slice
+        # of one preallocated RGBA array (no per-pixel alpha blending like a masked paste).
+        # Rows with fewer frames leave cells unfilled, so those start out transparent.
+        is_full_grid = num_columns * num_rows == len(frame_files)
+        sheet_pixels = (np.empty if is_full_grid else np.zeros)((total_height, total_width, 4), dtype=np.uint8)
 
-        sprite_sheet = Image.new('RGBA', (total_width, height))
+        def copy_frame(idx):
+            """Decodes frame idx straight into its cell of sheet_pixels."""
+            with Image.open(frame_files[idx]) as img:
+                if img.size != (width, height):
+                    raise ValueError(f"frame {frame_files[idx]} is {img.size[0]}x{img.size[1]}, expected {width}x{height}")
+                row, col = cells[idx]
+                cell = sheet_pixels[row * height:(row + 1) * height, col * width:(col + 1) * width]
+                if img.mode == 'RGBA': # Blender's normal output: copy the decoded pixels as-is
+                    cell[...] = np.asarray(img)
+                elif img.mode == 'RGB': # Opaque frame: copy color, fill alpha, no RGBA conversion pass
+                    cell[..., :3] = np.asarray(img)
+                    cell[..., 3] = 255
+                else: # Paletted/grayscale frames still need Pillow to expand them
+                    cell[...] = np.asarray(img.convert('RGBA'))
 
-        x_offset = 0
-        for img in images:
-            # Ensure image is RGBA for pasting with transparency
-            img_rgba = img if img.mode == 'RGBA' else img.convert('RGBA')
-            sprite_sheet.paste(img_rgba, (x_offset, 0), img_rgba) # Use alpha mask
-            x_offset += width
-            img.close() # Close the image file after pasting
-        images = [] # Clear list
+        # PNG/WebP decoding releases the GIL and every frame writes its own slice, so frames decode in parallel
+        with ThreadPoolExecutor(max_workers=min(len(frame_files), os.cpu_count() or 1)) as executor:
+            list(executor.map(copy_frame, range(len(frame_files))))
+        sprite_sheet = Image.fromarray(sheet_pixels)
 
         # Save in the requested format
         save_kwargs = {}
         if output_sheet_format == 'WEBP':
             # Check for WebP dimension limits before attempting save
             MAX_WEBP_DIMENSION = 16383 
-            if total_width > MAX_WEBP_DIMENSION or height > MAX_WEBP_DIMENSION:
-                print(f"WARNING (create_sprite_sheet): Image dimensions ({total_width}x{height}) exceed WebP limit ({MAX_WEBP_DIMENSION}px). Falling back to saving as PNG.")
+            if total_width > MAX_WEBP_DIMENSION or total_height > MAX_WEBP_DIMENSION:
+                print(f"WARNING (create_sprite_sheet): Image dimensions ({total_width}x{total_height}) exceed WebP limit ({MAX_WEBP_DIMENSION}px). Falling back to saving as PNG.")
                 # Fallback to PNG
                 output_sheet_format = 'PNG'
                 # No special kwargs needed for PNG save here
@@ -171,8 +351,8 @@ def create_sprite_sheet(frame_folder, output_sheet_path, base_name, input_file_e
                 # Continue execution to save as PNG below
             else:
                 # Proceed with saving as WebP if within limits
-                save_kwargs['quality'] = 95 
-                save_kwargs['lossless'] = False 
+                # method 4 is libwebp's default effort; lossy q90 is visually clean for rendered frames
+                save_kwargs = {'lossless': True, 'method': 4} if lossless else {'quality': 90, 'method': 4}
                 print(f"DEBUG: Saving sprite sheet as WEBP")
         
         # If format is not WEBP (either originally or due to fallback), ensure it's set to PNG
@@ -185,6 +365,12 @@ def create_sprite_sheet(frame_folder, output_sheet_path, base_name, input_file_e
         sprite_sheet.save(output_sheet_path, output_sheet_format, **save_kwargs)
         print(f"Sprite sheet saved to {output_sheet_path}")
 
+        if frame_map_path:
+            frame_map = {name: [col * width, row * height, width, height] for name, (row, col) in zip(frame_names, cells)}
+            with open(frame_map_path, 'w') as f:
+                json.dump(frame_map, f, indent=1)
+            print(f"Sprite sheet frame map saved to {frame_map_path}")
+
         # Clean up individual frames after successful sprite sheet creation
         print(f"Cleaning up {len(frame_files)} source frame files from {frame_folder}...")
         for f in frame_files:
@@ -196,10 +382,6 @@ def create_sprite_sheet(frame_folder, output_sheet_path, base_name, input_file_e
         print(f"ERROR (create_sprite_sheet): Unexpected error during sheet creation for {base_name}: {e}") # Added ERROR
         # ... (cleanup logic similar to zip function) ...
         return False
-    finally:
-        for img in images: # Ensure cleanup
-            try: img.close()
-            except: pass
 
 # --- Zipping Function (modified to zip specific files if needed) ---
 def zip_output(items_to_zip, output_zip_path, base_arc_dir=None):
@@ -211,21 +393,18 @@ def zip_output(items_to_zip, output_zip_path, base_arc_dir=None):
     if not items_to_zip:
         print("Error: No items provided to zip.")
         return False
-    if is_dir_mode and not glob.glob(os.path.join(items_to_zip[0], '**', '*'), recursive=True):
-         print(f"Error: Directory {items_to_zip[0]} is empty or contains no files to zip.")
-         return False # Prevent empty zips from dirs
-         
+    files_written = 0
     try:
         print(f"Creating zip file: {output_zip_path}")
-        with zipfile.ZipFile(output_zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        # PNG/WebP frames are already compressed; re-DEFLATEing them burns CPU for no size gain
+        with zipfile.ZipFile(output_zip_path, 'w', zipfile.ZIP_STORED) as zipf:
             if is_dir_mode:
                 base_dir = items_to_zip[0]
                 print(f"Zipping directory recursively: {base_dir}")
-                for root, _, files in os.walk(base_dir):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.relpath(file_path, base_dir)
-                        zipf.write(file_path, arcname=arcname)
+                for file_path in iter_files(base_dir):
+                    arcname = os.path.relpath(file_path, base_dir)
+                    zip_write_stored(zipf, file_path, arcname)
+                    files_written += 1
             else: # List of files (sprite sheets)
                 print(f"Zipping individual files: {items_to_zip}")
                 for item_path in items_to_zip:
@@ -233,42 +412,537 @@ def zip_output(items_to_zip, output_zip_path, base_arc_dir=None):
                      arcname = os.path.basename(item_path)
                      # Check the *original* full path exists before writing
                      if os.path.exists(item_path):
-                         zipf.write(item_path, arcname=arcname) # Write full path, store as basename
+                         zip_write_stored(zipf, item_path, arcname) # Read full path, store as basename
                      else:
                          print(f"Warning: File not found for zipping: {item_path}")
-        print(f"Successfully created zip file: {output_zip_path}")
-        return True
     except Exception as e:
         print(f"Error creating zip file: {e}")
         return False
 
-# --- Pillow Post-Processing: Add Thick Black Outline ---
+    if is_dir_mode and not files_written:
+        # Prevent empty zips from dirs (only known after the single pass)
+        print(f"Error: Directory {items_to_zip[0]} is empty or contains no files to zip.")
+        try: os.remove(output_zip_path)
+        except OSError as e_rem: print(f"Warning: Could not remove empty zip file {output_zip_path}: {e_rem}")
+        return False
+    print(f"Successfully created zip file: {output_zip_path}")
+    return True
+
+# --- Post-Processing: Add Thick Black Outline ---
+def dilate_mask(mask, radius):
+    """Binary dilation of a boolean array by a (2*radius+1)^2 square, done as two separable 1-D passes.
+    Each pass ORs shifted slices, so the cost is O(radius) vectorized ops instead of a per-pixel k*k rank filter."""
+    out = mask.copy()
+    for axis in (0, 1):
+        src = out.copy()
+        for shift in range(1, radius + 1):
+            if axis == 0:
+                out[shift:] |= src[:-shift]
+                out[:-shift] |= src[shift:]
+            else:
+                out[:, shift:] |= src[:, :-shift]
+                out[:, :-shift] |= src[:, shift:]
+    return out
+
+def erode_mask(mask, radius):
+    """Binary erosion by a (2*radius+1)^2 square (dilation of the complement)."""
+    return ~dilate_mask(~mask, radius)
+
+def _outline_one_frame(f_path, thickness, overlap):
+    """Outlines a single frame in place (see apply_post_outline_to_frames)."""
+    try:
+        # Decode fully and close the file before anything is written back over the same path
+        with Image.open(f_path) as img:
+            img.load()
+        if img.mode != 'RGBA': # Blender writes RGBA; only foreign frames need converting
+            img = img.convert('RGBA')
+        mask = np.asarray(img.getchannel('A')) > 0
+        if not mask.any() or mask.all():
+            # Fully transparent or fully opaque frame: there is no edge to outline, skip the morphology and re-encode
+            return
+        outline_only = dilate_mask(mask, thickness) & ~erode_mask(mask, overlap)
+        outline_img = Image.new('RGBA', img.size, (0,0,0,0))
+        outline_img.paste((0,0,0,255), mask=Image.fromarray(outline_only.astype(np.uint8) * 255))
+        out = Image.alpha_composite(outline_img, img)
+        out.save(f_path, **(WEBP_FRAME_SAVE_KWARGS if f_path.lower().endswith('.webp') else PNG_FRAME_SAVE_KWARGS))
+    except Exception as e:
+        print(f"Warning: Failed to apply outline to {f_path}: {e}")
+
 def apply_post_outline_to_frames(frame_folder_path, thickness=10, overlap=8):
-    """Adds a thick black outline to all PNGs and WebPs in the folder using Pillow.
-    The outline will overlap the object by 'overlap' pixels."""
+    """Adds a thick black outline to all PNGs and WebPs in the folder and its angle subfolders.
+    The outline will overlap the object by 'overlap' pixels. Frames of every angle share one thread pool;
+    NumPy and Pillow's PNG/WebP codecs release the GIL for the heavy parts."""
     print(f"DEBUG: Applying post-process outline to frames in {frame_folder_path} (thickness={thickness}, overlap={overlap})...")
-    patterns_to_try = ['*.png', '*.webp']
-    processed_files = set()
-    for pattern in patterns_to_try:
-        for f_path in glob.glob(os.path.join(frame_folder_path, pattern)):
-            if f_path in processed_files: continue
-            try:
-                img = Image.open(f_path).convert('RGBA')
-                alpha = img.split()[-1]
-                mask = alpha.point(lambda p: 255 if p > 0 else 0, mode='1')
-                outline_mask = mask.filter(ImageFilter.MaxFilter(thickness*2+1))
-                eroded_mask = mask.filter(ImageFilter.MinFilter(overlap*2+1))
-                outline_only = ImageChops.subtract(outline_mask.convert('L'), eroded_mask.convert('L'))
-                outline_img = Image.new('RGBA', img.size, (0,0,0,0))
-                outline_pixels = outline_only.point(lambda p: 255 if p > 0 else 0)
-                outline_img.paste((0,0,0,255), mask=outline_pixels)
-                out = Image.alpha_composite(outline_img, img)
-                out.save(f_path)
-                processed_files.add(f_path)
-            except Exception as e:
-                print(f"Warning: Failed to apply outline to {f_path}: {e}")
+    frame_paths = [f_path for f_path in iter_files(frame_folder_path) if f_path.lower().endswith(('.png', '.webp'))]
+    if frame_paths:
+        with ThreadPoolExecutor(max_workers=min(len(frame_paths), os.cpu_count() or 1)) as executor:
+            list(executor.map(lambda f_path: _outline_one_frame(f_path, thickness, overlap), frame_paths))
     print(f"DEBUG: Finished post-process outlining in {frame_folder_path}.")
 
+# --- Persistent Blender Workers ---
+class BlenderWorker:
+    """One long-lived `blender --background --python blender_worker.py` process.
+    Jobs go in as JSON lines on stdin; stdout is read until the worker's done marker."""
+    def __init__(self):
+        self.process = subprocess.Popen(
+            [blender_executable, "--background", "--python", BLENDER_WORKER_SCRIPT],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            text=True, bufsize=1)
+        # Reader thread so run() can time out instead of blocking forever on readline()
+        self.lines = queue.Queue()
+        threading.Thread(target=self._read_stdout, daemon=True).start()
+        print(f"DEBUG: Started Blender worker (pid {self.process.pid})")
+
+    def _read_stdout(self):
+        for line in self.process.stdout:
+            self.lines.put(line)
+        self.lines.put(None) # EOF: the worker exited
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def run(self, job, timeout):
+        """Sends one job and waits for its done marker. Returns (ok, error); raises TimeoutExpired.
+        Render output goes to the job's log_path; anything else the worker prints is echoed as it arrives."""
+        self.process.stdin.write(json.dumps(job) + "\n")
+        self.process.stdin.flush()
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                line = self.lines.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                raise subprocess.TimeoutExpired(self.process.args, timeout)
+            if line is None:
+                return False, f"Blender worker exited unexpectedly (exit code {self.process.wait()})"
+            if line.startswith(BLENDER_WORKER_DONE_MARKER):
+                result = json.loads(line[len(BLENDER_WORKER_DONE_MARKER):])
+                return result['ok'], result['error']
+            print(f"[blender {self.process.pid}] {line}", end='')
+
+    def kill(self):
+        if self.is_alive():
+            self.process.kill()
+        self.process.wait()
+
+_idle_blender_workers = []
+_idle_blender_workers_lock = threading.Lock()
+# One slot per busy (checked out) worker; idle workers don't hold one. A new process is only started when the idle
+# list is empty, i.e. when every live worker is busy, so live processes never exceed MAX_BLENDER_WORKERS either
+_blender_worker_slots = threading.BoundedSemaphore(MAX_BLENDER_WORKERS)
+
+def acquire_blender_worker():
+    """Returns an idle worker, or starts a new one. Blocks while MAX_BLENDER_WORKERS workers are busy.
+    Every acquired worker must be handed back with release_blender_worker or discard_blender_worker."""
+    _blender_worker_slots.acquire()
+    try:
+        with _idle_blender_workers_lock:
+            while _idle_blender_workers:
+                worker = _idle_blender_workers.pop()
+                if worker.is_alive():
+                    return worker
+        return BlenderWorker()
+    except BaseException:
+        _blender_worker_slots.release()
+        raise
+
+def release_blender_worker(worker):
+    """Returns a worker to the idle pool; dead workers are dropped."""
+    if worker.is_alive():
+        with _idle_blender_workers_lock:
+            _idle_blender_workers.append(worker)
+    _blender_worker_slots.release()
+
+def discard_blender_worker(worker):
+    """Kills a worker that can't be trusted with another job (timed out, broken pipe, garbled output)."""
+    try:
+        worker.kill()
+    finally:
+        _blender_worker_slots.release()
+
+@atexit.register
+def _shutdown_blender_workers():
+    with _idle_blender_workers_lock:
+        for worker in _idle_blender_workers:
+            worker.process.stdin.close() # EOF ends the worker loop and Blender exits
+        _idle_blender_workers.clear()
+# --- End Persistent Blender Workers ---
+
+# --- Blender Job Invocation ---
+def _read_log_tail(log_path, max_chars=2000):
+    """Returns the last max_chars of a Blender log file (for error reports)."""
+    try:
+        with open(log_path, 'r', errors='replace') as f:
+            return f.read()[-max_chars:]
+    except OSError:
+        return "(no log written)"
+
+def run_blender_job(job, label, log_path=None, timeout=BLENDER_JOB_TIMEOUT):
+    """Runs one job dict on a persistent Blender worker, streaming its output to log_path.
+    Returns (returncode, error_msg); error_msg is None on success. Never raises: a worker that fails
+    mid-job (timeout, died before/while reading the job, unreadable done line) is killed, not reused."""
+    if log_path:
+        job = dict(job, log_path=os.path.abspath(log_path))
+    try:
+        worker = acquire_blender_worker()
+    except FileNotFoundError:
+        error_msg = f"ERROR: Blender executable not found at '{blender_executable}'. Halting processing."
+        print(error_msg)
+        return None, error_msg
+    except Exception as e:
+        error_msg = f"ERROR: Could not start a Blender worker for {label}: {e}"
+        print(error_msg)
+        return None, error_msg
+
+    reusable = False
+    try:
+        print(f"Dispatching Blender job ({label}) to worker {worker.process.pid}: {job}")
+        ok, error = worker.run(job, timeout=timeout)
+        reusable = True
+        if not ok:
+            error_msg = f"ERROR: Blender failed for {label}: {error}"
+            print(error_msg)
+            if log_path: print(f"Blender log tail ({label}, {log_path}):\n{_read_log_tail(log_path)}")
+            return 1, error_msg
+        return 0, None
+    except subprocess.TimeoutExpired as e:
+        error_msg = f"ERROR: Blender process timed out for {label} after {e.timeout} seconds."
+        print(error_msg)
+        if log_path: print(f"Blender log tail (partial, {label}, {log_path}):\n{_read_log_tail(log_path)}")
+        return None, error_msg
+    except Exception as e:
+        # e.g. BrokenPipeError if the worker died before reading the job, or a garbled done line
+        error_msg = f"ERROR: Blender worker failed for {label}: {type(e).__name__}: {e}"
+        print(error_msg)
+        if log_path: print(f"Blender log tail ({label}, {log_path}):\n{_read_log_tail(log_path)}")
+        return None, error_msg
+    finally:
+        # A stuck or broken worker can't be reused; kill it so the next job gets a fresh one
+        if reusable:
+            release_blender_worker(worker)
+        else:
+            discard_blender_worker(worker)
+
+def _run_blender_for_angles(batch_index, angles, base_job, abs_base_temp_dir, use_flat_structure, output_name_prefix, log_dir=None,
+                            frame_shard=None):
+    """Renders a batch of angles in one Blender job: base_job (the per-upload fields) plus each angle's output dir/name.
+    The scene is loaded once per batch and only the camera changes per angle. frame_shard=(index, count) renders only
+    that share of each angle's frames. Logs to log_dir/batch_<n>.log. Returns (angle_output_dirs, returncode, error_msg)."""
+    print(f"--- Processing Angles (batch {batch_index}): {angles} --- ")
+    angle_targets = []
+    for angle in angles:
+        angle_str_safe = f"{angle:.1f}".replace('.', '_') # Format angle for filename
+        if use_flat_structure:
+            # Save directly into base_temp_dir, angle in filename
+            angle_output_dir = abs_base_temp_dir
+        else:
+            # Use angle-specific subdirectories (Manual mode)
+            angle_output_dir = os.path.join(abs_base_temp_dir, f"angle_{angle_str_safe}")
+            os.makedirs(angle_output_dir, exist_ok=True)
+        angle_targets.append({'angle': angle, 'output_dir': angle_output_dir, 'output_name': f"{output_name_prefix}{angle_str_safe}"})
+
+    job = dict(base_job, angles=angle_targets)
+    if frame_shard:
+        job['frame_shard'] = list(frame_shard)
+    log_path = os.path.join(log_dir, f"batch_{batch_index}.log") if log_dir else None
+    returncode, error_msg = run_blender_job(job, f"angles {angles}", log_path, timeout=BLENDER_JOB_TIMEOUT * len(angles))
+    return [target['output_dir'] for target in angle_targets], returncode, error_msg
+# --- End Blender Job Invocation ---
+
+# --- Background Job Queue ---
+def _expire_finished_jobs(now=None):
+    """Drops finished job records older than JOB_RECORD_TTL. Caller must hold JOBS_LOCK."""
+    cutoff = (now or time.time()) - JOB_RECORD_TTL
+    expired = [job_id for job_id, job in JOBS.items() if job.get('finished_at', cutoff) < cutoff]
+    for job_id in expired:
+        del JOBS[job_id]
+    if expired: print(f"Expired {len(expired)} finished job record(s)")
+
+def submit_job(job_id, job_queue, func, *args):
+    """Registers a job as PENDING and schedules func(*args) on the given queue."""
+    with JOBS_LOCK:
+        _expire_finished_jobs()
+        JOBS[job_id] = {'state': 'PENDING'}
+    job_queue.submit(_run_job, job_id, func, *args)
+    schedule_scratch_sweep()
+
+def remove_temp_paths(paths):
+    """Deletes the given files/directories, logging (not raising) failures. Runs on CLEANUP_QUEUE."""
+    for path in paths:
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+            print(f"Cleaned up temporary path: {path}")
+        except FileNotFoundError:
+            pass
+        except OSError as e_rem:
+            print(f"Warning: Could not remove temporary path {path}: {e_rem}")
+
+def sweep_stale_scratch_files(now=None):
+    """Deletes previews and prepared scenes older than SCRATCH_FILE_TTL from both scratch roots.
+    Scenes of jobs that are still queued or running are kept however old they are. Runs on CLEANUP_QUEUE."""
+    cutoff = (now or time.time()) - SCRATCH_FILE_TTL
+    with JOBS_LOCK:
+        active_jobs = {job_id for job_id, job in JOBS.items() if job['state'] in ('PENDING', 'STARTED')}
+    stale_paths = []
+    candidates = glob.glob(os.path.join(app.config['PREVIEW_FOLDER'], '*'))
+    for scratch_dir in {app.config['SCRATCH_FOLDER'], DISK_SCRATCH_DIR}:
+        for blend_path in glob.glob(os.path.join(scratch_dir, 'uploads', '*_scene.blend')):
+            if os.path.basename(blend_path)[:-len('_scene.blend')] not in active_jobs:
+                candidates.append(blend_path)
+    for path in candidates:
+        try:
+            if os.path.getmtime(path) < cutoff:
+                stale_paths.append(path)
+        except OSError:
+            pass # Already removed
+    if stale_paths:
+        print(f"Removing {len(stale_paths)} stale preview/scene file(s)")
+        remove_temp_paths(stale_paths)
+
+def evict_cached_zips(now=None):
+    """Deletes cached zips unused for OUTPUT_CACHE_MAX_AGE, then the least recently used ones until OUTPUT_FOLDER
+    is under OUTPUT_CACHE_MAX_BYTES. Zips finished or reused within JOB_RECORD_TTL are kept, so a download link
+    the status page just handed out keeps working. Runs on CLEANUP_QUEUE."""
+    now = now or time.time()
+    zips = []
+    for path in glob.glob(os.path.join(app.config['OUTPUT_FOLDER'], '*.zip')):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue # Already removed
+        zips.append((stat.st_mtime, stat.st_size, path))
+    zips.sort() # Least recently used first
+    total_bytes = sum(size for _, size, _ in zips)
+    evicted = []
+    for mtime, size, path in zips:
+        if now - mtime < JOB_RECORD_TTL:
+            break
+        if now - mtime < OUTPUT_CACHE_MAX_AGE and total_bytes <= OUTPUT_CACHE_MAX_BYTES:
+            break
+        evicted.append(path)
+        total_bytes -= size
+    if evicted:
+        print(f"Evicting {len(evicted)} cached zip(s) from {app.config['OUTPUT_FOLDER']}")
+        remove_temp_paths(evicted)
+
+def schedule_scratch_sweep():
+    """Queues sweep_stale_scratch_files, so requests never wait on the directory scan."""
+    CLEANUP_QUEUE.submit(sweep_stale_scratch_files)
+
+def _run_job(job_id, func, *args):
+    """Queue worker wrapper: runs the job and records its final state."""
+    with JOBS_LOCK:
+        JOBS[job_id]['state'] = 'STARTED'
+    try:
+        filename, message = func(*args)
+    except Exception as e:
+        print(f"ERROR: Job {job_id} raised an unexpected error: {e}")
+        import traceback
+        traceback.print_exc()
+        filename, message = None, f"Unexpected error: {e}"
+    with JOBS_LOCK:
+        if filename:
+            JOBS[job_id].update(state='SUCCESS', filename=filename, message=message, finished_at=time.time())
+            CLEANUP_QUEUE.submit(evict_cached_zips) # A new zip may have pushed the cache over its limits
+        else:
+            JOBS[job_id].update(state='FAILURE', error=message, finished_at=time.time())
+        print(f"Job {job_id} finished with state {JOBS[job_id]['state']}")
+# --- End Background Job Queue ---
+
+def process_upload_job(unique_id, input_path, angles_to_process, num_frames, auto_angles_mode, render_style,
+                       pixel_resolution, output_format, output_type, final_zip_filename, scratch_dir=None):
+    """Renders all angles for a saved upload, post-processes the frames and zips them to final_zip_filename.
+    Runs on a job queue thread. Returns (final_zip_filename, message) on success or (None, error_summary).
+    scratch_dir is the scratch root the upload was saved under (SCRATCH_FOLDER unless it didn't fit there).
+    """
+    scratch_dir = scratch_dir or app.config['SCRATCH_FOLDER']
+    output_file_extension = output_format.lower()
+    # Sheet frames are only intermediates that get re-encoded into the sheet, so Blender writes them lossless (PNG)
+    # and output_format's (possibly lossy) encode happens once, on the sheet itself
+    frame_format = 'PNG' if output_type == 'sheet' else output_format
+    frame_file_extension = frame_format.lower()
+    # Base directory for all temporary frames for this request
+    base_temp_dir = os.path.join(scratch_dir, f"frames_{unique_id}")
+    sheet_output_dir = scratch_dir # Sheets are zipped then deleted, so they stay in scratch too
+    final_output_dir = app.config['OUTPUT_FOLDER']
+    final_zip_path = os.path.join(final_output_dir, final_zip_filename)
+    # Zips are built under a temporary name and renamed when complete, so a cache lookup never finds a partial zip
+    partial_zip_path = os.path.join(final_output_dir, f".{unique_id}.zip.part")
+
+    # Scene prepared once (FBX import + style setup) and reused by every angle; kept out of base_temp_dir so it isn't zipped
+    blend_cache_path = os.path.abspath(os.path.join(scratch_dir, 'uploads', f"{unique_id}_scene.blend"))
+    # Blender output is written straight to per-job log files here instead of being piped through Python
+    log_dir = os.path.join(scratch_dir, f"logs_{unique_id}")
+
+    os.makedirs(base_temp_dir, exist_ok=True)
+    os.makedirs(log_dir, exist_ok=True)
+    blender_errors = [] # Store errors from Blender runs
+    items_to_finally_zip = []
+
+    try:
+        # Fields shared by every Blender job of this upload, built once; angle jobs only add output dir/name + angle
+        base_job = {
+            'input': os.path.abspath(input_path),
+            'blend_path': blend_cache_path,
+            'num_frames': num_frames,
+            'render_style': render_style,
+            'output_format': frame_format,
+        }
+        if pixel_resolution is not None and render_style in PIXEL_STYLES:
+            base_job.update(pixel_resolution=pixel_resolution, upscale_resolution=PIXEL_UPSCALE_RESOLUTION)
+
+        # --- Prepare the scene once ---
+        prep_job = dict(base_job, prepare=True)
+        _, prep_error = run_blender_job(prep_job, "scene preparation", os.path.join(log_dir, "prepare.log"))
+        if prep_error:
+            if "Blender executable not found" in prep_error:
+                return None, "Processing failed: Blender not found."
+            return None, f"Processing failed while preparing the scene: {prep_error}"
+
+        # --- Dispatch angles to Blender in parallel ---
+        # One batch per worker: each batch loads the prepared scene once and renders its angles back to back.
+        # With fewer angles than workers, each angle's frames are split into shards instead so no worker sits idle.
+        print(f"Processing with Output: {output_type}, Style: {render_style}, Format: {output_format}, Angles: {angles_to_process}")
+        use_flat_structure = (auto_angles_mode != 'off')
+        shard_count = max(1, min(MAX_PARALLEL_RENDERS // len(angles_to_process), num_frames))
+        if shard_count > 1:
+            angle_batches = [([angle], (shard, shard_count)) for angle in angles_to_process for shard in range(shard_count)]
+        else:
+            batch_count = min(len(angles_to_process), MAX_PARALLEL_RENDERS)
+            angle_batches = [(angles_to_process[i::batch_count], None) for i in range(batch_count)]
+        max_workers = len(angle_batches)
+        print(f"DEBUG: Rendering {len(angles_to_process)} angles in {len(angle_batches)} batches ({shard_count} frame shards per angle) on up to {max_workers} Blender workers")
+        abs_base_temp_dir = os.path.abspath(base_temp_dir)
+        output_name_prefix = f"{unique_id}_angle_"
+
+        def render_batch(batch_index):
+            batch_angles, frame_shard = angle_batches[batch_index]
+            return _run_blender_for_angles(batch_index, batch_angles, base_job, abs_base_temp_dir,
+                                           use_flat_structure, output_name_prefix, log_dir, frame_shard)
+
+        # Output dirs are collected as batches return, so post-processing doesn't rescan base_temp_dir for them
+        angle_dirs = set()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for batch_output_dirs, returncode, error_msg in executor.map(render_batch, range(len(angle_batches))):
+                angle_dirs.update(batch_output_dirs)
+                if error_msg:
+                    blender_errors.append(error_msg)
+        angle_dirs = sorted(angle_dirs)
+        # --- End Dispatch ---
+
+        # Proceed only if Blender was found and at least some angles might have succeeded
+        if "Blender executable not found" in ''.join(blender_errors):
+             return None, "Processing failed: Blender not found."
+
+        # --- Post-Processing (Upscale / Create Sheets / Zip) --- 
+        zip_created = False
+        items_to_finally_zip = []
+        base_dir_for_zip_arc = None
+        
+        if output_type == 'sheet':
+            print(f"DEBUG: Creating sprite sheets from {base_temp_dir}...")
+            created_sheets = []
+            use_flat_structure = (auto_angles_mode != 'off')
+            
+            if use_flat_structure:
+                # Create ONE sheet from all frames in the flat base directory: a near-square grid of the
+                # single-frame angles, plus a JSON frame map so each angle/frame can be found in it
+                sheet_output_path = os.path.join(sheet_output_dir, f"{unique_id}_{auto_angles_mode}angles.{output_file_extension}")
+                frame_map_path = os.path.join(sheet_output_dir, f"{unique_id}_{auto_angles_mode}angles.json")
+                frames_base_name = f"{unique_id}_angle" # Matches every angle's {unique_id}_angle_<angle>_<frame> files
+                sheet_success = create_sprite_sheet(base_temp_dir, sheet_output_path, frames_base_name, frame_file_extension, output_format,
+                                                    frame_map_path, lossless=render_style in PIXEL_STYLES)
+                if sheet_success:
+                    created_sheets.extend([sheet_output_path, frame_map_path])
+                else:
+                     blender_errors.append("Failed to create single sprite sheet for auto-angles.")
+                     
+            else: # Not auto_angles (Manual mode) - process angle by angle
+                if not angle_dirs:
+                     blender_errors.append("No angle directories found after rendering.")
+                else:
+                    def build_angle_sheet(angle_dir):
+                        angle_name = os.path.basename(angle_dir) # e.g., "angle_45_0"
+                        angle_output_name = f"{unique_id}_{angle_name}" 
+                        sheet_output_path = os.path.join(sheet_output_dir, f"{angle_output_name}.{output_file_extension}") 
+                        # Pass input extension AND desired output format
+                        sheet_success = create_sprite_sheet(angle_dir, sheet_output_path, angle_output_name, frame_file_extension, output_format,
+                                                            lossless=render_style in PIXEL_STYLES)
+                        return angle_name, sheet_output_path, sheet_success
+
+                    # One angle at a time: create_sprite_sheet already decodes each sheet's frames on a thread pool,
+                    # so only one sheet buffer is held at once
+                    for angle_name, sheet_output_path, sheet_success in map(build_angle_sheet, angle_dirs):
+                        if sheet_success:
+                            created_sheets.append(sheet_output_path)
+                        else:
+                             blender_errors.append(f"Failed to create sprite sheet for {angle_name}.")
+            
+            if created_sheets:
+                items_to_finally_zip = created_sheets
+                # Zip individual sheets directly into the root of the zip
+                base_dir_for_zip_arc = None 
+                print(f"DEBUG: Zipping created sprite sheets: {created_sheets}")
+                zip_created = zip_output(items_to_finally_zip, partial_zip_path, base_dir_for_zip_arc)
+            else:
+                print("Error: No sprite sheets were successfully created.")
+                # zip_created remains False
+                
+        else: # output_type == 'zip' (individual frames)
+            # Pixel styles arrive already upscaled from Blender; only the post outline is applied here
+            if render_style in ['pixel_post_outline', 'pixel_post_thin_outline']:
+                print(f"DEBUG: Starting post-render outlining (Style: {render_style})")
+                outline_thickness = 10 if render_style == 'pixel_post_outline' else 4
+                # One pass over base_temp_dir covers both the flat layout and the per-angle subfolders,
+                # so frames from all angles are outlined in parallel rather than one angle dir at a time
+                apply_post_outline_to_frames(base_temp_dir, thickness=outline_thickness, overlap=8)
+                print("DEBUG: Finished post-render outlining.")
+                
+            # Zip the frames
+            items_to_finally_zip = [base_temp_dir]
+            # Base dir for zip is None, so it zips contents directly
+            print(f"DEBUG: Zipping individual frames directory: {base_temp_dir}")
+            zip_created = zip_output(items_to_finally_zip, partial_zip_path)
+        # --- End Post-Processing ---
+
+        # --- Final Response Handling --- 
+        if zip_created and os.path.exists(partial_zip_path):
+             if blender_errors:
+                 # Don't let a partial result answer future identical requests: publish it under this job's own id
+                 final_zip_filename = f"{unique_id}_{final_zip_filename}"
+                 final_zip_path = os.path.join(final_output_dir, final_zip_filename)
+             os.replace(partial_zip_path, final_zip_path)
+             final_message = f"Processing complete. Ready to download {final_zip_filename}."
+             if blender_errors:
+                 final_message += " Note: Some angles may have encountered errors (check server logs)."
+             print(final_message)
+             return final_zip_filename, final_message
+        else:
+            error_summary = "Processing failed (Zipping step or no frames rendered)." 
+            if blender_errors:
+                error_summary += f" Blender errors encountered: {'; '.join(blender_errors)}"
+            print(error_summary)
+            return None, error_summary
+
+    except Exception as e:
+        # Catch other potential errors during rendering or post-processing
+        print(f"ERROR: An unexpected outer error occurred: {e}")
+        import traceback
+        traceback.print_exc()
+        # Ensure cleanup is attempted even for outer errors
+        blender_errors.append(f"Outer error: {e}") 
+        return None, f"An unexpected error occurred during processing. Check server logs. Errors: {'; '.join(blender_errors)}"
+    finally:
+        # --- Cleanup ---
+        # Input, cached scene, frames (all angle subdirs), logs, and sheets if they were created outside the temp dir.
+        # Deleting thousands of frames can take a while, so it runs on the cleanup queue and the job finishes now.
+        temp_paths = [input_path, blend_cache_path, base_temp_dir, log_dir, partial_zip_path]
+        if output_type == 'sheet':
+            temp_paths.extend(items_to_finally_zip)
+        CLEANUP_QUEUE.submit(remove_temp_paths, temp_paths)
+
 @app.route('/')
 def index():
     """Renders the main upload page."""
@@ -278,6 +952,8 @@ def index():
 def preview_render():
     """Handles generating a single frame preview."""
     print("--- DEBUG (/preview): Route hit ---") # Added Debug
+    if not BLENDER_OK:
+        return jsonify({'error': f"Blender executable not found at '{blender_executable}'. Configure blender_executable in app.py."}), 503
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
     file = request.files['file']
@@ -292,7 +968,7 @@ def preview_render():
              # Fallback: Use the first selected standard angle or 0 if none selected
              selected_angles = request.form.getlist('angles')
              angle = selected_angles[0] if selected_angles else '0'
-        output_format = request.form.get('output_format', 'PNG')
+        output_format = request.form.get('output_format', 'WEBP')
         pixel_resolution = request.form.get('pixel_resolution', '128') # Get pixel res
 
         print(f"--- DEBUG (/preview): Received style='{render_style}', angle='{angle}', format='{output_format}', pixel_res='{pixel_resolution}'") # Added Debug
@@ -300,8 +976,10 @@ def preview_render():
         # Use a unique ID for the preview to prevent conflicts
         preview_id = f"preview_{uuid.uuid4().hex[:8]}"
         fbx_filename = f"{preview_id}.fbx"
-        fbx_path = os.path.join(app.config['UPLOAD_FOLDER'], fbx_filename)
-        file.save(fbx_path)
+        scratch_dir = request.scratch_dir or app.config['SCRATCH_FOLDER']
+        fbx_path = os.path.join(scratch_dir, 'uploads', fbx_filename)
+        save_upload(file, fbx_path)
+        schedule_scratch_sweep()
 
         # Define output path for the single preview frame
         preview_output_name = f"{preview_id}_angle_{angle}" 
@@ -310,42 +988,33 @@ def preview_render():
         # Important: Ensure the preview output dir exists
         os.makedirs(preview_output_dir, exist_ok=True)
 
-        # Construct command for Blender script (rendering frame 1)
-        cmd_args = [
-            blender_executable, 
-            '--background', 
-            '--python', 'scripts/process_fbx.py', '--',
-            '--input', fbx_path,
-            '--output_dir', preview_output_dir, # Pass absolute path
-            '--output_name', preview_output_name, # Pass base name
-            '--num_frames', '1', # Changed from --frames to --num_frames
-            '--angle', str(angle),
-            '--render_style', render_style,
-            '--output_format', output_format, # Pass format
-            '--pixel_resolution', pixel_resolution # Pass pixel res
-        ]
-        print(f"--- DEBUG (/preview): Running command: {cmd_args}") # Added Debug
+        preview_log_path = os.path.join(scratch_dir, f"{preview_id}.log")
 
         try:
-            # Run Blender script
-            result = subprocess.run(cmd_args, check=True, capture_output=True, text=True)
-            print("--- DEBUG (/preview): Blender script STDOUT ---") # Added Debug
-            print(result.stdout)
-            print("--- DEBUG (/preview): Blender script STDERR ---") # Added Debug
-            print(result.stderr)
-            print(f"--- DEBUG (/preview): Blender script return code: {result.returncode}") # Added Debug
-            
-            # --- Add a small delay before checking files --- 
-            time.sleep(1.0) # Increased delay to 1 second
-            print("--- DEBUG (/preview): Delay finished. Proceeding with file check.")
-            # -------------------------------------------
-            
-            # --- Perform Upscaling if Pixelated Style --- 
-            if render_style in ['pixel_cel', 'pixel_outline', 'pixel_post_outline', 'pixel_post_thin_outline']:
-                 print(f"--- DEBUG (/preview): Upscaling pixelated preview frame in {preview_output_dir}...")
-                 upscale_pixelated_frames(preview_output_dir, 1024) # Upscale to 1024x1024
-            # -------------------------------------------
-            
+            # Single-frame job for a persistent worker, so a preview doesn't pay Blender's startup cost
+            preview_job = {
+                'input': os.path.abspath(fbx_path),
+                'output_dir': preview_output_dir, # Pass absolute path
+                'output_name': preview_output_name, # Pass base name
+                'num_frames': 1,
+                'angle': float(angle),
+                'render_style': render_style,
+                'output_format': output_format, # Pass format
+                'pixel_resolution': int(pixel_resolution), # Pass pixel res
+            }
+            if render_style in PIXEL_STYLES:
+                # Blender writes the pixelated frame already upscaled, no Python post-pass needed
+                preview_job['upscale_resolution'] = PIXEL_UPSCALE_RESOLUTION
+
+            # Run the preview on a Blender worker
+            returncode, error_msg = run_blender_job(preview_job, "preview", preview_log_path)
+            blender_log = _read_log_tail(preview_log_path)
+            print(f"--- DEBUG (/preview): Blender job finished (return code: {returncode})") # Added Debug
+            if error_msg:
+                print(f"ERROR (/preview): Blender job failed: {error_msg}")
+                return jsonify({'error': 'Blender processing failed', 'details': f"{error_msg}\n{blender_log}"}), 500
+
+            # No delay needed: the worker only reports done after the frame file has been written and closed
             # --- Find the generated preview image (using the specific expected name) --- 
             # IMPORTANT: Blender script adds a frame index (_0000 for the first frame)
             expected_filename = f"{preview_output_name}_0000.{output_format.lower()}"
@@ -362,11 +1031,7 @@ def preview_render():
 
             # Check if the specific file exists
             if os.path.exists(output_frame_path):
-                # preview_file = output_frame_path # Variable not really needed
                 preview_url = url_for('serve_preview', filename=os.path.basename(output_frame_path))
-                # Clean up the uploaded FBX used only for preview
-                try: os.remove(fbx_path); print(f"Cleaned up preview FBX: {fbx_path}")
-                except OSError as e: print(f"Warning: Could not remove preview FBX {fbx_path}: {e}")
                 return jsonify({'success': True, 'preview_url': preview_url})
             else:
                 # --- Enhanced Debugging for File Not Found --- 
@@ -376,8 +1041,7 @@ def preview_render():
                     "preview_dir_abs_path": preview_output_dir,
                     "listdir_of_preview_dir": [],
                     "glob_in_preview_dir": [],
-                    "blender_stdout": result.stdout if 'result' in locals() and hasattr(result, 'stdout') else "N/A",
-                    "blender_stderr": result.stderr if 'result' in locals() and hasattr(result, 'stderr') else "N/A (or Blender process did not complete)"
+                    "blender_log": blender_log,
                 }
                 try:
                     debug_details["listdir_of_preview_dir"] = os.listdir(preview_output_dir)
@@ -387,50 +1051,40 @@ def preview_render():
                 
                 print(f"ERROR (/preview): Preview file not found. Debug details: {debug_details}")
                 # ---------------------------------------------
-                 # Clean up FBX even on failure
-                try: os.remove(fbx_path); print(f"Cleaned up failed preview FBX: {fbx_path}")
-                except OSError as e: print(f"Warning: Could not remove failed preview FBX {fbx_path}: {e}")
                 return jsonify({'error': 'Preview generation failed (file not found by Flask)', 'details': debug_details}), 500
 
-        except subprocess.CalledProcessError as e:
-            print(f"ERROR (/preview): Blender script failed. Return code: {e.returncode}")
-            print("--- DEBUG (/preview): Blender failure STDOUT ---")
-            print(e.stdout)
-            print("--- DEBUG (/preview): Blender failure STDERR ---")
-            print(e.stderr)
-            # Clean up FBX on failure
-            try: os.remove(fbx_path); print(f"Cleaned up failed preview FBX: {fbx_path}")
-            except OSError as e_rem: print(f"Warning: Could not remove failed preview FBX {fbx_path}: {e_rem}")
-            return jsonify({'error': 'Blender processing failed', 'details': e.stderr}), 500
         except Exception as e:
              print(f"ERROR (/preview): Unexpected error during preview: {e}")
-             # Clean up FBX on failure
-             try: os.remove(fbx_path); print(f"Cleaned up failed preview FBX: {fbx_path}")
-             except OSError as e_rem: print(f"Warning: Could not remove failed preview FBX {fbx_path}: {e_rem}")
              return jsonify({'error': 'Unexpected server error during preview', 'details': str(e)}), 500
+        finally:
+            # The uploaded FBX and the Blender log are only needed for this one preview
+            for temp_path in (fbx_path, preview_log_path):
+                try: os.remove(temp_path); print(f"Cleaned up preview file: {temp_path}")
+                except FileNotFoundError: pass
+                except OSError as e_rem: print(f"Warning: Could not remove preview file {temp_path}: {e_rem}")
 
     return jsonify({'error': 'Invalid file type'}), 400
 
 @app.route('/output/previews/<filename>')
 def serve_preview(filename):
-    # Basic security check
-    if '..' in filename or filename.startswith('/'):
+    # safe_join rejects absolute paths and anything that normalizes outside the preview dir
+    file_path_to_serve = safe_join(os.path.abspath(app.config["PREVIEW_FOLDER"]), filename)
+    if file_path_to_serve is None:
         return "Invalid filename", 400
-
-    # Use absolute path to ensure correct serving directory
-    preview_dir_abs = os.path.abspath(app.config["PREVIEW_FOLDER"])
-    
-    # --- Add Logging --- 
-    file_path_to_serve = os.path.join(preview_dir_abs, filename)
     print(f"--- DEBUG (serve_preview): Attempting to serve file: {file_path_to_serve}")
-    print(f"--- DEBUG (serve_preview): File exists check: {os.path.exists(file_path_to_serve)}")
-    # -----------------
-    
-    return send_from_directory(preview_dir_abs, filename)
+    if not os.path.isfile(file_path_to_serve):
+        return "File not found.", 404
+    # Preview filenames carry a fresh random id per render, so a given URL's content never changes
+    response = send_file(file_path_to_serve, max_age=PREVIEW_CACHE_MAX_AGE) # send_file also sets ETag/Last-Modified
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    """Handles file upload, triggers Blender processing for angles/styles, and zips frames."""
+    """Handles file upload and queues Blender processing for angles/styles. Returns a job ID to poll via /status."""
+    if not BLENDER_OK:
+        return f"Blender executable not found at '{blender_executable}'. Configure blender_executable in app.py.", 503
     if 'file' not in request.files:
         return redirect(request.url)
     file = request.files['file']
@@ -475,18 +1129,17 @@ def upload_file():
 
         # Get Render Style and Pixel Resolution
         render_style = request.form.get('render_style', 'bright')
-        valid_styles = ['bright', 'cel', 'unlit', 'original_unlit', 'wireframe', 'clay', 'pixel_cel', 'cel_outline', 'cel_thicker_outline', 'pixel_outline', 'pixel_post_outline', 'pixel_post_thin_outline']
-        if render_style not in valid_styles: render_style = 'bright'
+        if render_style not in VALID_STYLES: render_style = 'bright'
         pixel_resolution = None
-        if render_style in ['pixel_cel', 'pixel_outline', 'pixel_post_outline', 'pixel_post_thin_outline']:
+        if render_style in PIXEL_STYLES:
             pixel_resolution = int(request.form.get('pixel_resolution', 128))
             pixel_resolution = max(16, min(pixel_resolution, 256))
             print(f"DEBUG (Process): Pixelation resolution requested: {pixel_resolution}")
 
         # --- Get Output Format --- 
-        output_format = request.form.get('output_format', 'PNG').upper()
-        if output_format not in ['PNG', 'WEBP']: output_format = 'PNG'
-        output_file_extension = output_format.lower()
+        # WebP by default: sprite content encodes much smaller than PNG, so downloads are smaller
+        output_format = request.form.get('output_format', 'WEBP').upper()
+        if output_format not in ['PNG', 'WEBP']: output_format = 'WEBP'
         # --- End Get Output Format ---
 
         # --- Get Output Type --- 
@@ -501,225 +1154,68 @@ def upload_file():
     if file and allowed_file(file.filename):
         unique_id = str(uuid.uuid4())
         input_filename = f"{unique_id}.fbx"
-        input_path = os.path.join(app.config['UPLOAD_FOLDER'], input_filename)
-        # Base directory for all temporary frames for this request
-        base_temp_dir = os.path.join(app.config['OUTPUT_FOLDER'], f"frames_{unique_id}")
-        final_output_dir = app.config['OUTPUT_FOLDER']
-        final_zip_filename = f"{unique_id}_{render_style}_{output_format}_{output_type}.zip"
-        final_zip_path = os.path.join(final_output_dir, final_zip_filename)
-
-        os.makedirs(base_temp_dir, exist_ok=True)
-        blender_errors = [] # Store errors from Blender runs
-
+        scratch_dir = request.scratch_dir or app.config['SCRATCH_FOLDER']
+        input_path = os.path.join(scratch_dir, 'uploads', input_filename)
         try:
-            file.save(input_path)
+            save_upload(file, input_path)
             print(f"File saved to {input_path}")
-            abs_input_path = os.path.abspath(input_path)
-            script_path = os.path.join("scripts", "process_fbx.py")
+        except Exception as e:
+            print(f"ERROR: Could not save uploaded file to {input_path}: {e}")
+            return "Could not save uploaded file. Check server logs.", 500
 
-            # --- Loop through angles and call Blender ---
-            print(f"Processing with Output: {output_type}, Style: {render_style}, Format: {output_format}, Angles: {angles_to_process}")
-            use_flat_structure = (auto_angles_mode != 'off')
-            
-            for angle in angles_to_process:
-                print(f"--- Processing Angle: {angle} --- ")
-                angle_str_safe = f"{angle:.1f}".replace('.', '_') # Format angle for filename
-                
-                if use_flat_structure:
-                    # Save directly into base_temp_dir, angle in filename
-                    angle_output_dir = base_temp_dir
-                    # Format filename to include angle with one decimal place
-                    angle_output_name = f"{unique_id}_angle_{angle_str_safe}" 
-                else:
-                    # Use angle-specific subdirectories (Manual mode)
-                    angle_output_dir = os.path.join(base_temp_dir, f"angle_{angle_str_safe}")
-                    angle_output_name = f"{unique_id}_angle_{angle_str_safe}"
-                    os.makedirs(angle_output_dir, exist_ok=True)
-                    
-                abs_angle_output_dir = os.path.abspath(angle_output_dir)
-                
-                command = [
-                    blender_executable,
-                    "--background",
-                    "--python", script_path,
-                    "--", 
-                    "--input", abs_input_path,
-                    "--output_dir", abs_angle_output_dir, 
-                    "--output_name", angle_output_name,
-                    "--num_frames", str(num_frames),
-                    "--angle", str(angle),
-                    "--render_style", render_style,
-                    "--output_format", output_format
-                ]
-                if pixel_resolution is not None and render_style in ['pixel_cel', 'pixel_outline', 'pixel_post_outline', 'pixel_post_thin_outline']:
-                     command.extend(["--pixel_resolution", str(pixel_resolution)])
-                
-                try:
-                    print(f"Running Blender command: {' '.join(command)}")
-                    process = subprocess.run(command, check=True, capture_output=True, text=True, timeout=300)
-                    print(f"Blender STDOUT (Angle {angle}):\n{process.stdout}")
-                    if process.stderr:
-                        print(f"Blender STDERR (Angle {angle}):\n{process.stderr}")
-                except subprocess.CalledProcessError as e:
-                    error_msg = f"ERROR: Blender process failed for angle {angle} (Exit code {e.returncode}). STDERR: {e.stderr[:500]}..."
-                    print(error_msg)
-                    print(f"Blender STDOUT (Angle {angle}):\n{e.stdout}") # Show stdout on error too
-                    blender_errors.append(error_msg)
-                    # Continue to next angle even if one fails?
-                    # Or break here: break 
-                except FileNotFoundError:
-                     error_msg = f"ERROR: Blender executable not found at '{blender_executable}'. Halting processing."
-                     print(error_msg)
-                     blender_errors.append(error_msg)
-                     break # Stop processing if Blender isn't found
-                except subprocess.TimeoutExpired as e:
-                     error_msg = f"ERROR: Blender process timed out for angle {angle} after {e.timeout} seconds."
-                     print(error_msg)
-                     if e.stdout: print(f"Blender STDOUT (partial, Angle {angle}):\n{e.stdout}")
-                     if e.stderr: print(f"Blender STDERR (partial, Angle {angle}):\n{e.stderr}")
-                     blender_errors.append(error_msg)
-                     # Continue or break?
-            # --- End Loop ---
-
-            # Proceed only if Blender was found and at least some angles might have succeeded
-            if "Blender executable not found" in ''.join(blender_errors):
-                 return "Processing failed: Blender not found.", 500
-
-            # --- Post-Processing (Upscale / Create Sheets / Zip) --- 
-            zip_created = False
-            items_to_finally_zip = []
-            base_dir_for_zip_arc = None
-            
-            if output_type == 'sheet':
-                print(f"DEBUG: Creating sprite sheets from {base_temp_dir}...")
-                created_sheets = []
-                use_flat_structure = (auto_angles_mode != 'off')
-                
-                if use_flat_structure:
-                    # Create ONE sheet from all frames in the flat base directory
-                    sheet_output_path = os.path.join(final_output_dir, f"{unique_id}_{auto_angles_mode}angles.{output_file_extension}")
-                    base_name_for_glob = f"{unique_id}_angle_*" # Glob pattern for frames
-                    
-                    # Upscale first if needed (operate on base_temp_dir)
-                    if render_style in ['pixel_cel', 'pixel_outline', 'pixel_post_outline', 'pixel_post_thin_outline']:
-                         print(f"DEBUG: Upscaling frames in {base_temp_dir} before sheet creation...")
-                         upscale_pixelated_frames(base_temp_dir, 1024)
-                         
-                    sheet_success = create_sprite_sheet(base_temp_dir, sheet_output_path, base_name_for_glob, output_file_extension, output_format)
-                    if sheet_success:
-                        created_sheets.append(sheet_output_path)
-                    else:
-                         blender_errors.append("Failed to create single sprite sheet for auto-angles.")
-                         
-                else: # Not auto_angles (Manual mode) - process angle by angle
-                    angle_dirs = sorted(glob.glob(os.path.join(base_temp_dir, 'angle_*'))) 
-                    if not angle_dirs:
-                         blender_errors.append("No angle directories found after rendering.")
-                    else:
-                        for angle_dir in angle_dirs:
-                            angle_name = os.path.basename(angle_dir) # e.g., "angle_45_0"
-                            angle_output_name = f"{unique_id}_{angle_name}" 
-                            sheet_output_path = os.path.join(final_output_dir, f"{angle_output_name}.{output_file_extension}") 
-                            
-                            # Upscale first if needed
-                            if render_style in ['pixel_cel', 'pixel_outline', 'pixel_post_outline', 'pixel_post_thin_outline']:
-                                 print(f"DEBUG: Upscaling frames in {angle_dir} before sheet creation...")
-                                 upscale_pixelated_frames(angle_dir, 1024)
-                                 
-                            # Pass input extension AND desired output format
-                            sheet_success = create_sprite_sheet(angle_dir, sheet_output_path, angle_output_name, output_file_extension, output_format)
-                            if sheet_success:
-                                created_sheets.append(sheet_output_path)
-                            else:
-                                 blender_errors.append(f"Failed to create sprite sheet for {angle_name}.")
-                
-                if created_sheets:
-                    items_to_finally_zip = created_sheets
-                    # Zip individual sheets directly into the root of the zip
-                    base_dir_for_zip_arc = None 
-                    print(f"DEBUG: Zipping created sprite sheets: {created_sheets}")
-                    zip_created = zip_output(items_to_finally_zip, final_zip_path, base_dir_for_zip_arc)
-                else:
-                    print("Error: No sprite sheets were successfully created.")
-                    # zip_created remains False
-                    
-            else: # output_type == 'zip' (individual frames)
-                # Upscale first if needed
-                use_flat_structure = (auto_angles_mode != 'off')
-                if render_style in ['pixel_cel', 'pixel_outline', 'pixel_post_outline', 'pixel_post_thin_outline']:
-                    print(f"DEBUG: Starting post-render upscaling (Style: {render_style})")
-                    if use_flat_structure:
-                        # Upscale directly in base_temp_dir
-                        upscale_pixelated_frames(base_temp_dir, 1024)
-                        if render_style == 'pixel_post_outline':
-                            apply_post_outline_to_frames(base_temp_dir, thickness=10, overlap=8)
-                        elif render_style == 'pixel_post_thin_outline':
-                            apply_post_outline_to_frames(base_temp_dir, thickness=4, overlap=8)
-                    else:
-                        # Upscale in each angle subdirectory
-                        angle_dirs = glob.glob(os.path.join(base_temp_dir, 'angle_*'))
-                        for angle_dir in angle_dirs:
-                            upscale_pixelated_frames(angle_dir, 1024)
-                            if render_style == 'pixel_post_outline':
-                                apply_post_outline_to_frames(angle_dir, thickness=10, overlap=8)
-                            elif render_style == 'pixel_post_thin_outline':
-                                apply_post_outline_to_frames(angle_dir, thickness=4, overlap=8)
-                    print("DEBUG: Finished post-render upscaling.")
-                    
-                # Zip the frames
-                items_to_finally_zip = [base_temp_dir]
-                # Base dir for zip is None, so it zips contents directly
-                print(f"DEBUG: Zipping individual frames directory: {base_temp_dir}")
-                zip_created = zip_output(items_to_finally_zip, final_zip_path)
-            # --- End Post-Processing ---
-
-            # --- Final Response Handling --- 
-            if zip_created and os.path.exists(final_zip_path):
-                 final_message = f"Processing complete. Redirecting to download {final_zip_filename}."
-                 if blender_errors:
-                     final_message += " Note: Some angles may have encountered errors (check server logs)."
-                 print(final_message)
-                 return redirect(url_for('download_file', filename=final_zip_filename))
-            else:
-                error_summary = "Processing failed (Zipping step or no frames rendered)." 
-                if blender_errors:
-                    error_summary += f" Blender errors encountered: {'; '.join(blender_errors)}"
-                print(error_summary)
-                return error_summary, 500
+        # Same file + same settings as an earlier job: its zip is still in the output folder, so skip rendering
+        render_params = {'angles': angles_to_process, 'num_frames': num_frames, 'auto_angles_mode': auto_angles_mode,
+                         'render_style': render_style, 'pixel_resolution': pixel_resolution,
+                         'output_format': output_format, 'output_type': output_type}
+        cache_key = render_cache_key(file_sha256(file), render_params)
+        final_zip_filename = f"{cache_key}_{render_style}_{output_format}_{output_type}.zip"
+        cached_zip_path = os.path.join(app.config['OUTPUT_FOLDER'], final_zip_filename)
+        if os.path.isfile(cached_zip_path):
+            try:
+                os.utime(cached_zip_path) # Counts as a use for evict_cached_zips
+            except OSError:
+                pass
+            remove_temp_paths([input_path])
+            with JOBS_LOCK:
+                _expire_finished_jobs()
+                JOBS[unique_id] = {'state': 'SUCCESS', 'filename': final_zip_filename, 'finished_at': time.time(),
+                                   'message': f"Reused the earlier render of this file. Ready to download {final_zip_filename}."}
+            print(f"Job {unique_id} matched cached output {final_zip_filename}, skipping render")
+            return jsonify({'job_id': unique_id, 'status_url': url_for('job_status', job_id=unique_id)}), 202
 
-        except Exception as e:
-            # Catch other potential errors during file save or setup
-            print(f"ERROR: An unexpected outer error occurred: {e}")
-            import traceback
-            traceback.print_exc()
-            # Ensure cleanup is attempted even for outer errors
-            blender_errors.append(f"Outer error: {e}") 
-            return f"An unexpected error occurred during setup or processing. Check server logs. Errors: {'; '.join(blender_errors)}", 500
-        finally:
-            # --- Cleanup ---
-            if os.path.exists(input_path):
-                try: os.remove(input_path); print(f"Cleaned up input file: {input_path}")
-                except OSError as e_rem: print(f"Warning: Could not remove input file {input_path}: {e_rem}")
-            # Remove the base temp directory containing all angle subdirs
-            if os.path.exists(base_temp_dir):
-                try: shutil.rmtree(base_temp_dir); print(f"Cleaned up temporary frame directory: {base_temp_dir}")
-                except OSError as e_rem: print(f"Warning: Could not remove temporary frame directory {base_temp_dir}: {e_rem}")
-            # Cleanup individual sheets if they were created outside temp dir
-            if output_type == 'sheet' and items_to_finally_zip:
-                 print(f"Cleaning up individual sprite sheets...")
-                 for sheet_path in items_to_finally_zip:
-                     if os.path.exists(sheet_path):
-                         try: os.remove(sheet_path)
-                         except OSError as e: print(f"Warning: Failed to remove sheet {sheet_path}: {e}")
+        # Pixel styles do CPU-heavy post-processing, keep them on their own queue so they don't starve light renders
+        is_pixel_style = render_style in PIXEL_STYLES
+        job_queue = PIXEL_JOB_QUEUE if is_pixel_style else RENDER_JOB_QUEUE
+        submit_job(unique_id, job_queue, process_upload_job, unique_id, input_path, angles_to_process, num_frames,
+                   auto_angles_mode, render_style, pixel_resolution, output_format, output_type, final_zip_filename,
+                   scratch_dir)
+        print(f"Queued job {unique_id} on the {'pixel' if is_pixel_style else 'render'} queue")
+        return jsonify({'job_id': unique_id, 'status_url': url_for('job_status', job_id=unique_id)}), 202
 
     else:
         return 'Invalid file type.', 400
 
+@app.route('/status/<job_id>')
+def job_status(job_id):
+    """Reports the state of a queued render job; includes the download URL once it has succeeded."""
+    with JOBS_LOCK:
+        job = dict(JOBS.get(job_id, {}))
+    if not job:
+        return jsonify({'job_id': job_id, 'state': 'UNKNOWN', 'error': 'Unknown job ID'}), 404
+
+    response = {'job_id': job_id, 'state': job['state']}
+    if job['state'] == 'SUCCESS':
+        response['download_url'] = url_for('download_file', filename=job['filename'])
+        response['message'] = job.get('message')
+    elif job['state'] == 'FAILURE':
+        response['error'] = job.get('error')
+    return jsonify(response)
+
 @app.route('/output/<filename>')
 def download_file(filename):
     """Serves the generated zip file for download."""
     allowed_extensions = ('.zip', '.png', '.webp')
-    if '..' in filename or filename.startswith('/') or not filename.lower().endswith(allowed_extensions):
+    if not filename.lower().endswith(allowed_extensions):
          return "Invalid filename or file type for download.", 400
     # Determine mimetype based on extension
     mimetype = 'application/octet-stream' # Default
@@ -731,16 +1227,29 @@ def download_file(filename):
     serve_dir = app.config["OUTPUT_FOLDER"]
     if filename.startswith("preview_"):
         serve_dir = app.config["PREVIEW_FOLDER"]
-        
-    return send_from_directory(serve_dir, filename, as_attachment=True, mimetype=mimetype)
+
+    # safe_join rejects absolute paths and anything that normalizes outside serve_dir
+    file_path = safe_join(os.path.abspath(serve_dir), filename)
+    if file_path is None:
+        return "Invalid filename or file type for download.", 400
+    if not os.path.isfile(file_path):
+        return "File not found.", 404
+
+    if serve_dir == app.config["OUTPUT_FOLDER"] and app.config["ACCEL_REDIRECT_PREFIX"]:
+        # nginx serves the bytes from its internal location; Flask only sends headers
+        return Response(headers={
+            'X-Accel-Redirect': f"{app.config['ACCEL_REDIRECT_PREFIX'].rstrip('/')}/{filename}",
+            'Content-Type': mimetype,
+            'Content-Disposition': f'attachment; filename="{filename}"',
+        })
+
+    return send_file(file_path, as_attachment=True, mimetype=mimetype)
 
 if __name__ == '__main__':
     # Make sure Blender path is configured above before running!
     print(f"Using Blender executable: {blender_executable}")
-    if not os.path.exists(blender_executable) and blender_executable == "blender":
-         print("Warning: 'blender' command used, ensure it's in your system's PATH.")
-    elif not os.path.exists(blender_executable):
-         print(f"ERROR: Blender executable not found at specified path: {blender_executable}")
+    if not BLENDER_OK:
+         print(f"ERROR: Blender executable not found at specified path or on PATH: {blender_executable}")
          print("Please install Blender and/or configure the correct path in app.py")
          # sys.exit(1) # Optionally exit if Blender isn't configured
 
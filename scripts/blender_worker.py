@@ -0,0 +1,98 @@
+import bpy
+import sys
+import os
+import json
+import traceback
+
+# Make process_fbx importable when Blender runs this file via --python
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import process_fbx
+
+# Printed on its own line after each job so the app knows the job finished.
+# Any other stdout line (e.g. Blender startup output) is just log text.
+DONE_MARKER = "BLENDER_WORKER_DONE"
+
+def redirect_output(stdout_fd, stderr_fd):
+    """Points fds 1/2 at the given fds so both Python prints and Blender's own C-level logging follow."""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.dup2(stdout_fd, 1)
+    os.dup2(stderr_fd, 2)
+
+def run_job(job):
+    """Runs one job on a clean Blender state. Returns an error string or None on success.
+    Jobs with 'prepare' save the prepared scene to 'blend_path'; other jobs render from that cache when 'blend_path'
+    is given, else import the FBX themselves. 'angles' (a list of {angle, output_dir, output_name}) renders several
+    angles in one job, optionally only a 'frame_shard' [index, count] of their frames; otherwise a single
+    'angle'/'output_dir'/'output_name' is rendered."""
+    blend_path = job.get('blend_path')
+    try:
+        if blend_path and not job.get('prepare'):
+            # Loading the prepared .blend replaces the whole scene, so no factory reset needed
+            bpy.ops.wm.open_mainfile(filepath=blend_path)
+        else:
+            # Each job expects the same starting scene a fresh `blender --background` would give it
+            bpy.ops.wm.read_factory_settings(use_empty=False)
+
+        if job.get('prepare'):
+            process_fbx.save_prepared_scene(
+                job['input'], blend_path, job['render_style'], job['output_format'],
+                job.get('pixel_resolution'), job.get('upscale_resolution'), job.get('num_frames'))
+            return None
+
+        if 'angles' in job:
+            # Several angles in one job: the scene stays loaded and only the camera changes between them
+            if not blend_path:
+                process_fbx.prepare_scene(
+                    job['input'], job['render_style'], job['output_format'],
+                    job.get('pixel_resolution'), job.get('upscale_resolution'))
+            angle_targets = [(a['angle'], a['output_dir'], a['output_name']) for a in job['angles']]
+            process_fbx.render_prepared_angles(
+                angle_targets, job['num_frames'], job['output_format'], job.get('upscale_resolution'),
+                job.get('frame_shard'))
+        elif blend_path:
+            os.makedirs(job['output_dir'], exist_ok=True)
+            process_fbx.render_prepared_scene(
+                job['output_dir'], job['output_name'], job['num_frames'], job['angle'],
+                job['output_format'], job.get('upscale_resolution'))
+        else:
+            os.makedirs(job['output_dir'], exist_ok=True)
+            process_fbx.render_animation(
+                job['input'], job['output_dir'], job['output_name'], job['num_frames'], job['angle'],
+                job['render_style'], job['output_format'], job.get('pixel_resolution'), job.get('upscale_resolution'))
+    except SystemExit as e:
+        # process_fbx calls sys.exit(1) on import/object errors; that must not kill the worker
+        return f"Render exited with status {e.code}"
+    except Exception as e:
+        traceback.print_exc()
+        return f"Render raised {type(e).__name__}: {e}"
+    return None
+
+if __name__ == "__main__":
+    # Protocol lines go to a private copy of the original stdout; fds 1/2 are pointed at
+    # the job's log file while it runs so render chatter never travels through the app's pipe
+    original_stdout_fd = os.dup(1)
+    original_stderr_fd = os.dup(2)
+    protocol_out = os.fdopen(os.dup(1), 'w', buffering=1)
+
+    # Long-lived loop: one JSON job per stdin line, one DONE_MARKER line per job on the protocol stream
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        log_fd = None
+        try:
+            job = json.loads(line)
+            if job.get('log_path'):
+                log_fd = os.open(job['log_path'], os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+                redirect_output(log_fd, log_fd)
+            error = run_job(job)
+        except Exception as e:
+            traceback.print_exc()
+            error = f"Worker failed to run job: {e}"
+        finally:
+            if log_fd is not None:
+                redirect_output(original_stdout_fd, original_stderr_fd)
+                os.close(log_fd)
+        protocol_out.write(f"{DONE_MARKER} {json.dumps({'ok': error is None, 'error': error})}\n")
+        protocol_out.flush()
@@ -4,53 +4,165 @@ import os
 import argparse
 import math # Added for rotation
 import mathutils # Import needed for bounding box calculations
-
-def get_object_world_dimensions(obj):
-    """Calculate the world-space dimensions of an object based on its bounding box corners."""
+import numpy as np # Bundled with Blender; used for Nearest Neighbor upscaling of pixel styles and bounds math
+
+# Scene custom property naming the object the camera should frame (set by prepare_scene)
+TARGET_OBJECT_PROP = "sprite_target_object"
+# Style groups, as sets so each style check is one hash lookup
+LIT_STYLES = frozenset({'bright', 'cel', 'clay', 'pixel_cel', 'cel_outline', 'cel_thicker_outline', 'pixel_outline', 'pixel_post_outline'})
+PIXEL_STYLES = frozenset({'pixel_cel', 'pixel_outline', 'pixel_post_outline', 'pixel_post_thin_outline'})
+POST_OUTLINE_STYLES = frozenset({'pixel_post_outline', 'pixel_post_thin_outline'}) # Outlined by the app after rendering
+OUTLINE_MODIFIER_STYLES = frozenset({'cel_outline', 'cel_thicker_outline', 'pixel_outline'}) # Outlined in Blender
+CEL_STYLES = frozenset({'cel', 'cel_outline', 'cel_thicker_outline'})
+MATERIAL_OVERRIDE_STYLES = frozenset({'clay', 'wireframe'}) # Replace the model's materials instead of restyling them
+FLAT_STYLES = frozenset({'unlit', 'original_unlit', 'wireframe', 'blueprint'}) # Emission or Freestyle only, no lighting to sample
+# Per-frame and per-material step-by-step debug lines only when FBX2SPRITE_VERBOSE is set
+# (they add up for hundreds of tiny frames or FBX files with many materials)
+VERBOSE = bool(os.environ.get("FBX2SPRITE_VERBOSE"))
+# Opt-in early stop for the frame_set bounds scan: FBX2SPRITE_BOUNDS_STABLE_SAMPLES=K stops once K samples in a row
+# haven't grown the bounds. Faster for long idle loops, but a late move after a long still stretch gets cropped.
+BOUNDS_STABLE_SAMPLES = int(os.environ.get("FBX2SPRITE_BOUNDS_STABLE_SAMPLES") or 0) or None
+# Frame image settings: WebP quality (100 = lossless) and PNG compression percentage
+WEBP_FRAME_QUALITY = 90
+WEBP_PIXEL_QUALITY = 100
+PNG_FRAME_COMPRESSION = 15
+# Scene custom property with the animation's world bounds [min x, y, z, max x, y, z] (set by save_prepared_scene)
+ANIM_BOUNDS_PROP = "sprite_anim_bounds"
+
+def debug_print(message):
+    """print() for step-by-step details, only when VERBOSE is on."""
+    if VERBOSE:
+        print(message)
+
+def get_object_world_bounds(obj):
+    """Calculate the world-space (min, max) corners of an object's bounding box at the current frame.
+    Returns (None, None) if they can't be determined."""
     if not obj or not hasattr(obj, 'bound_box'):
-        print("DEBUG: Cannot get world dimensions, object has no bound_box.")
-        return None
+        print("DEBUG: Cannot get world bounds, object has no bound_box.")
+        return None, None
 
     # Get bounding box corner coordinates in world space
     try:
-        world_bbox_corners = [(obj.matrix_world @ mathutils.Vector(corner)) for corner in obj.bound_box]
-        print(f"DEBUG: World bounding box corners: {world_bbox_corners}")
+        world_bbox_corners = transform_corners(bound_box_array(obj), obj.matrix_world)
+        print(f"DEBUG: World bounding box corners: {world_bbox_corners.tolist()}")
     except Exception as e:
         print(f"DEBUG: Error calculating world corners: {e}")
-        return None
+        return None, None
 
-    if not world_bbox_corners:
-        print("DEBUG: Could not calculate world bounding box corners.")
-        return None
+    # Find min/max coordinates across all world corners (one reduction per side instead of per-axis generators)
+    min_coord = mathutils.Vector(world_bbox_corners.min(axis=0).tolist())
+    max_coord = mathutils.Vector(world_bbox_corners.max(axis=0).tolist())
+    print(f"DEBUG: World min coordinates: {min_coord}")
+    print(f"DEBUG: World max coordinates: {max_coord}")
+
+    return min_coord, max_coord
 
-    # Find min/max coordinates across all world corners
+def bound_box_array(obj):
+    """The object's 8 local bounding box corners as an (8, 3) float64 array."""
+    # One bulk copy of the 24 floats; builds where bound_box has no foreach_get (AttributeError) or rejects the
+    # flat buffer's type/size (TypeError/RuntimeError) fall back to per-corner slices
+    buf = np.empty(24, dtype=np.float32)
     try:
-        min_coord = mathutils.Vector((min(v[i] for v in world_bbox_corners) for i in range(3)))
-        max_coord = mathutils.Vector((max(v[i] for v in world_bbox_corners) for i in range(3)))
-        print(f"DEBUG: World min coordinates: {min_coord}")
-        print(f"DEBUG: World max coordinates: {max_coord}")
-    except Exception as e:
-        print(f"DEBUG: Error calculating min/max coords: {e}")
+        obj.bound_box.foreach_get(buf)
+    except (AttributeError, TypeError, RuntimeError):
+        return np.array([corner[:] for corner in obj.bound_box], dtype=np.float64)
+    return buf.reshape(8, 3).astype(np.float64)
+
+def transform_corners(corners, matrix_world):
+    """Applies a 4x4 world matrix to (N, 3) local corners in one matmul (same result as matrix_world @ Vector(c))."""
+    m = np.array(matrix_world, dtype=np.float64) # mathutils.Matrix converts row by row
+    return corners @ m[:3, :3].T + m[:3, 3]
+
+# Object transform channels get_fcurve_world_bounds can evaluate itself (Euler rotation only)
+TRANSFORM_FCURVE_PATHS = frozenset({'location', 'rotation_euler', 'scale'})
+
+def get_transform_only_fcurves(obj):
+    """Returns the object's action fcurves if they only drive its own location/rotation_euler/scale and nothing else
+    changes its world bounds (no parent, constraints, drivers, modifiers or shape keys), else None."""
+    anim = obj.animation_data
+    action = anim.action if anim else None
+    fcurves = getattr(action, 'fcurves', None) if action else None
+    if not fcurves or obj.type == 'ARMATURE' or obj.parent or obj.constraints or anim.drivers or obj.modifiers:
         return None
-
-    dimensions = max_coord - min_coord
-    print(f"DEBUG: Calculated world dimensions: {dimensions}")
-    return dimensions
-
-def get_animation_world_bounds(obj, start_frame, end_frame):
-    """Calculates the overall world-space bounding box across an animation range."""
-    print(f"DEBUG: Calculating animation bounds from frame {start_frame} to {end_frame}...")
-    overall_min = mathutils.Vector((float('inf'), float('inf'), float('inf')))
-    overall_max = mathutils.Vector((float('-inf'), float('-inf'), float('-inf')))
+    if obj.rotation_mode in ('QUATERNION', 'AXIS_ANGLE'):
+        return None
+    if getattr(obj.data, 'shape_keys', None):
+        return None
+    if any(fcu.data_path not in TRANSFORM_FCURVE_PATHS for fcu in fcurves):
+        return None
+    if any(obj.delta_location) or any(obj.delta_rotation_euler) or tuple(obj.delta_scale) != (1.0, 1.0, 1.0):
+        return None
+    return fcurves
+
+def get_fcurve_world_bounds(obj, fcurves, frames):
+    """World (min, max) arrays over the given frames, evaluating the transform fcurves directly (no frame_set,
+    so no depsgraph update per frame). The bounding box itself doesn't change since nothing deforms the mesh."""
+    # Start from the current channel values; animated channels are overwritten per frame
+    channels = {
+        'location': np.tile(np.array(obj.location, dtype=np.float64), (len(frames), 1)),
+        'rotation_euler': np.tile(np.array(obj.rotation_euler, dtype=np.float64), (len(frames), 1)),
+        'scale': np.tile(np.array(obj.scale, dtype=np.float64), (len(frames), 1)),
+    }
+    for fcu in fcurves:
+        channels[fcu.data_path][:, fcu.array_index] = [fcu.evaluate(frame) for frame in frames]
+
+    corners = bound_box_array(obj)
+    overall_min = np.full(3, np.inf)
+    overall_max = np.full(3, -np.inf)
+    Euler = mathutils.Euler
+    LocRotScale = mathutils.Matrix.LocRotScale
+    rotation_mode = obj.rotation_mode
+    for loc, rot, scale in zip(channels['location'].tolist(), channels['rotation_euler'].tolist(), channels['scale'].tolist()):
+        world_corners = transform_corners(corners, LocRotScale(loc, Euler(rot, rotation_mode), scale))
+        np.minimum(overall_min, world_corners.min(axis=0), out=overall_min)
+        np.maximum(overall_max, world_corners.max(axis=0), out=overall_max)
+    return overall_min, overall_max
+
+def get_animation_world_bounds(obj, start_frame, end_frame, stride=None, stable_samples=None):
+    """Calculates the overall world-space bounding box across an animation range.
+    Every stride-th frame (plus the last) is sampled; by default short animations (up to ~120 frames) are read
+    frame by frame and longer ones sampled ~60 times, since each frame_set re-evaluates the whole scene.
+    Opt-in: with stable_samples=K, sampling stops once K samples in a row haven't grown the bounds (a late move
+    after a long still stretch would then be missed, so callers pass BOUNDS_STABLE_SAMPLES, which is off by default)."""
+    # Fast path: plain object animation is evaluated straight from the fcurves, for every frame
+    fcurves = get_transform_only_fcurves(obj) if hasattr(obj, 'bound_box') else None
+    if fcurves:
+        print(f"DEBUG: Evaluating transform fcurves directly for frames {start_frame} to {end_frame}...")
+        try:
+            overall_min, overall_max = get_fcurve_world_bounds(obj, fcurves, range(start_frame, end_frame + 1))
+            overall_min, overall_max = mathutils.Vector(overall_min.tolist()), mathutils.Vector(overall_max.tolist())
+            print(f"DEBUG: Overall animation bounds: Min={overall_min}, Max={overall_max}")
+            return overall_min, overall_max
+        except Exception as e:
+            print(f"DEBUG: Direct fcurve evaluation failed ({e}), falling back to frame_set sampling.")
+
+    if stride is None:
+        stride = max(1, (end_frame - start_frame) // 60)
+    sample_frames = list(range(start_frame, end_frame + 1, stride))
+    if sample_frames[-1] != end_frame:
+        sample_frames.append(end_frame)
+    print(f"DEBUG: Calculating animation bounds from frame {start_frame} to {end_frame} ({len(sample_frames)} samples, stride {stride})...")
+    # Running min/max as arrays: each frame's 8 corners are reduced in NumPy instead of 24 Python min/max calls
+    overall_min = np.full(3, np.inf)
+    overall_max = np.full(3, -np.inf)
     has_bounds = False
+    stable_count = 0
     
     scene = bpy.context.scene
     original_frame = scene.frame_current
+    # Simplify with subdivision 0 while scanning: the armature still deforms the mesh, but subdivision surfaces
+    # aren't re-evaluated every sample (their result lies inside the cage, so the bounds stay conservative)
+    original_simplify = (scene.render.use_simplify, scene.render.simplify_subdivision)
+    scene.render.use_simplify = True
+    scene.render.simplify_subdivision = 0
 
     try:
-        # Consider sampling frames for performance on long animations (e.g., range(start, end + 1, 5))
-        for frame in range(start_frame, end_frame + 1):
-            scene.frame_set(frame)
+        for frame in sample_frames:
+            if scene.frame_current != frame:
+                scene.frame_set(frame)
+            else:
+                # Already on this frame: only evaluate whatever is still tagged dirty instead of a full frame change
+                bpy.context.view_layer.update()
             # We need the evaluated object at this frame. For simple cases, matrix_world might be okay,
             # but for complex rigs/modifiers, using the evaluated dependency graph is safer.
             # depsgraph = bpy.context.evaluated_depsgraph_get()
@@ -60,49 +172,60 @@ def get_animation_world_bounds(obj, start_frame, end_frame):
             if not hasattr(obj, 'bound_box'): continue
             
             try:
-                world_corners = [(obj.matrix_world @ mathutils.Vector(corner)) for corner in obj.bound_box]
-                if not world_corners: continue
+                # bound_box is re-read every frame: for deformed meshes Blender syncs the evaluated bounds back to it
+                world_corners = transform_corners(bound_box_array(obj), obj.matrix_world)
 
                 # Update overall min/max
-                for corner in world_corners:
-                    for i in range(3):
-                        overall_min[i] = min(overall_min[i], corner[i])
-                        overall_max[i] = max(overall_max[i], corner[i])
+                frame_min, frame_max = world_corners.min(axis=0), world_corners.max(axis=0)
+                grew = (frame_min < overall_min).any() or (frame_max > overall_max).any()
+                np.minimum(overall_min, frame_min, out=overall_min)
+                np.maximum(overall_max, frame_max, out=overall_max)
                 has_bounds = True
+                stable_count = 0 if grew else stable_count + 1
+                if stable_samples and stable_count >= stable_samples:
+                    print(f"DEBUG: Bounds unchanged for {stable_count} samples, stopping at frame {frame}.")
+                    break
             except Exception as e_inner:
                 print(f"DEBUG: Error getting bounds for frame {frame}: {e_inner}")
                 # Continue trying other frames
 
-        # Restore original frame
-        scene.frame_set(original_frame)
-
         if not has_bounds:
             print("DEBUG: Failed to calculate any bounds during animation.")
             return None, None
         
+        if stride > 1:
+            # Pad by 1% per side for motion between samples (setup_camera's 2.2x padding covers the rest)
+            margin = (overall_max - overall_min) * 0.01
+            overall_min -= margin
+            overall_max += margin
+        overall_min, overall_max = mathutils.Vector(overall_min.tolist()), mathutils.Vector(overall_max.tolist())
         print(f"DEBUG: Overall animation bounds: Min={overall_min}, Max={overall_max}")
         return overall_min, overall_max
 
     except Exception as e_outer:
         print(f"ERROR: Failed during animation bounds calculation: {e_outer}")
-        scene.frame_set(original_frame) # Ensure frame is reset on error
         return None, None
+    finally:
+        scene.render.use_simplify, scene.render.simplify_subdivision = original_simplify
+        # Restore original frame (on success and on error), unless the last sample already left us there
+        if scene.frame_current != original_frame:
+            scene.frame_set(original_frame)
 
-def setup_scene(render_style, output_format, pixel_resolution=None):
+def setup_scene(render_style, output_format, pixel_resolution=None, upscale_resolution=None):
     """Clears the default scene, sets up render settings (incl. format, pixelation) and lighting."""
     print(f"--- DEBUG (setup_scene): Received render_style = '{render_style}'") # Added Debug
-    # Delete default objects
-    bpy.ops.object.select_all(action='SELECT')
-    if bpy.context.selected_objects:
-        bpy.ops.object.delete(use_global=False)
+    # Delete default objects (data API: no operator context/undo push per call)
+    for obj in list(bpy.data.objects):
+        bpy.data.objects.remove(obj, do_unlink=True)
     
     # --- Add Lighting (Conditional) ---
     # Light needed for bright, cel, clay, pixel_cel, cel_outline, cel_thicker_outline, pixel_outline
-    if render_style in ['bright', 'cel', 'clay', 'pixel_cel', 'cel_outline', 'cel_thicker_outline', 'pixel_outline', 'pixel_post_outline']:
+    if render_style in LIT_STYLES:
         # Add a Sun light for clear directional lighting
-        bpy.ops.object.light_add(type='SUN', location=(0, 0, 5))
-        sun_light = bpy.context.object
-        sun_light.name = 'KeyLight'
+        sun_data = bpy.data.lights.new(name='KeyLight', type='SUN')
+        sun_light = bpy.data.objects.new('KeyLight', sun_data)
+        sun_light.location = (0, 0, 5)
+        bpy.context.scene.collection.objects.link(sun_light)
         sun_light.rotation_euler = (math.radians(45), math.radians(-30), math.radians(45))
         sun_light.data.energy = 3.0 
         print(f"DEBUG: Added Sun light for style '{render_style}'")
@@ -121,75 +244,164 @@ def setup_scene(render_style, output_format, pixel_resolution=None):
         print(f"DEBUG: Skipping extra lighting for style '{render_style}'")
     # --- End Add Lighting ---
 
-    # Set render settings
+    # Set render settings (Eevee Next for Blender 4.x+); only values that differ are written
     scene = bpy.context.scene
-    scene.render.engine = 'BLENDER_EEVEE_NEXT' # Use Eevee Next for Blender 4.x+
-    scene.render.film_transparent = True
-    scene.render.resolution_percentage = 100
+    set_if_changed(scene.render, engine='BLENDER_EEVEE_NEXT', film_transparent=True, resolution_percentage=100)
+    configure_eevee(scene, render_style)
 
     # Set resolution based on style
-    if render_style in ['pixel_cel', 'pixel_outline', 'pixel_post_outline', 'pixel_post_thin_outline'] and pixel_resolution: # Apply low-res to all pixel styles
+    if render_style in PIXEL_STYLES and pixel_resolution: # Apply low-res to all pixel styles
         target_res = int(pixel_resolution)
         print(f"DEBUG: Setting render resolution to {target_res}x{target_res} for pixelated style.")
-        scene.render.resolution_x = target_res
-        scene.render.resolution_y = target_res
+        # Unlit pixel colors go out as-is: 'Standard' skips the Filmic/AgX tone mapping pass
+        set_if_changed(scene.view_settings, view_transform='Standard')
     else:
+        target_res = 1024
         print("DEBUG: Setting render resolution to 1024x1024 (default).")
-        scene.render.resolution_x = 1024
-        scene.render.resolution_y = 1024
+    set_if_changed(scene.render, resolution_x=target_res, resolution_y=target_res)
     
-    # Set Output Format
-    if output_format == 'WEBP':
-        scene.render.image_settings.file_format = 'WEBP'
-        # Optional: Configure WebP settings (quality, lossless)
-        # scene.render.image_settings.quality = 90 
-        # scene.render.image_settings.webp_lossless = True 
-        print(f"DEBUG: Setting output format to WEBP")
-    else: # Default to PNG
-        scene.render.image_settings.file_format = 'PNG'
-        scene.render.image_settings.color_mode = 'RGBA' # Ensure RGBA for PNG
-        print(f"DEBUG: Setting output format to PNG")
+    # Set Output Format (default PNG)
+    file_format = 'WEBP' if output_format == 'WEBP' else 'PNG'
+    print(f"DEBUG: Setting output format to {file_format}")
+    # color_mode/depth go after file_format (changing the format can reset them): always 8-bit RGBA, so the app
+    # uses frames as-is with no palette/RGB expansion on the Python side
+    set_if_changed(scene.render.image_settings, file_format=file_format, color_mode='RGBA', color_depth='8')
+    if file_format == 'WEBP':
+        # Quality 100 is Blender's lossless WebP: kept for pixel styles' hard edges; other styles write
+        # smaller lossy frames at the same quality the app uses for WebP sheets
+        set_if_changed(scene.render.image_settings, quality=WEBP_PIXEL_QUALITY if render_style in PIXEL_STYLES else WEBP_FRAME_QUALITY)
+    else:
+        # Blender's fastest-but-still-compressed PNG level (frames are zipped stored, not deflated again)
+        set_if_changed(scene.render.image_settings, compression=PNG_FRAME_COMPRESSION)
 
     # --- Freestyle Setup (Conditional) ---
     if render_style == 'blueprint':
         print("--- DEBUG (setup_scene): ENTERING BLUEPRINT FREESTYLE SETUP ---") # Added Debug
         print("DEBUG: Enabling and configuring Freestyle for Blueprint style.")
-        scene.render.use_freestyle = True
+        set_if_changed(scene.render, use_freestyle=True)
         freestyle_settings = scene.view_layers["ViewLayer"].freestyle_settings
         # Try getting existing or add new
         lineset = freestyle_settings.linesets.get("BlueprintLines")
         if not lineset:
             lineset = freestyle_settings.linesets.new("BlueprintLines")
             
-        # Configure which lines to draw
-        lineset.select_silhouette = True
-        lineset.select_border = True
-        lineset.select_crease = True # Draw lines on sharp edges
-        lineset.select_edge_mark = False # Don't use manually marked edges for now
-        lineset.select_material_boundary = False
+        # Configure which lines to draw (crease = sharp edges; no manually marked edges for now)
+        set_if_changed(lineset, select_silhouette=True, select_border=True, select_crease=True,
+                       select_edge_mark=False, select_material_boundary=False)
         
-        # Configure line appearance
-        linestyle = lineset.linestyle
-        linestyle.color = (1.0, 1.0, 1.0) # White lines (RGB)
-        linestyle.alpha = 1.0 # Set alpha separately
-        linestyle.thickness = 1.5 # Adjust thickness as needed
+        # Configure line appearance: white lines, alpha set separately, thickness as needed
+        set_if_changed(lineset.linestyle, color=(1.0, 1.0, 1.0), alpha=1.0, thickness=1.5)
         # linestyle.use_alpha = False # Removed: Alpha controlled via color
     else:
-         scene.render.use_freestyle = False # Ensure it's off for other styles
+         set_if_changed(scene.render, use_freestyle=False) # Ensure it's off for other styles
     # --- End Freestyle Setup ---
 
-    # Ensure compositor is disabled - we are not using it
-    scene.use_nodes = False 
-
-def setup_camera(target_object, angle_degrees, anim_min=None, anim_max=None):
-    """Creates and positions an orthographic camera rotated around the target object.
-       Uses overall animation bounds if provided, otherwise falls back to frame 1 bounds.
+    # --- Compositor Setup ---
+    if upscale_resolution and render_style in PIXEL_STYLES and pixel_resolution:
+        # Low-res pixel renders are read back through a Viewer node and written once at the final size
+        setup_upscale_compositor(scene)
+    else:
+        # Ensure compositor is disabled - we are not using it
+        scene.use_nodes = False 
+    # --- End Compositor Setup ---
+
+def set_if_changed(target, **values):
+    """Assigns RNA properties only when they differ; every RNA write tags the depsgraph even for an identical value."""
+    for prop, value in values.items():
+        current = getattr(target, prop)
+        if isinstance(value, tuple):
+            current = tuple(current)
+        if current != value:
+            setattr(target, prop, value)
+
+def configure_eevee(scene, render_style):
+    """Turns off Eevee features sprites don't use and picks TAA samples for the style (1 pixel, 4 flat, 16 lit)."""
+    eevee = scene.eevee
+    # Screen-space ray tracing (reflections) and volumetric shadows add nothing to a sprite on a transparent film.
+    # Ambient occlusion and bloom do show on lit styles, so only flat and pixel styles turn those off too.
+    # hasattr guards: these properties moved between Blender versions
+    disabled_props = ['use_raytracing', 'use_ssr', 'use_volumetric_shadows']
+    if render_style in FLAT_STYLES or render_style in PIXEL_STYLES:
+        disabled_props += ['use_gtao', 'use_bloom']
+    for prop in disabled_props:
+        if hasattr(eevee, prop):
+            setattr(eevee, prop, False)
+    if render_style in PIXEL_STYLES:
+        # Pixel look wants hard, aliased edges at the low render resolution
+        eevee.taa_render_samples = 1
+        print(f"DEBUG: Eevee TAA render samples set to 1 for pixel style '{render_style}'")
+    elif render_style in FLAT_STYLES:
+        # Flat emission/line output only needs a few samples to smooth the silhouette
+        eevee.taa_render_samples = 4
+        print(f"DEBUG: Eevee TAA render samples set to 4 for flat style '{render_style}'")
+    else:
+        # Lit styles: 16 samples resolve the sun shading and edges of a sprite-sized subject; Blender's default is 64
+        eevee.taa_render_samples = 16
+        print(f"DEBUG: Eevee TAA render samples set to 16 for lit style '{render_style}'")
+
+def setup_upscale_compositor(scene):
+    """Routes the render result into a Viewer node so save_upscaled_render can read the pixels back."""
+    print("DEBUG: Enabling compositor with Viewer node for in-Blender upscaling.")
+    scene.use_nodes = True
+    tree = scene.node_tree
+    tree.nodes.clear()
+    render_layers_node = tree.nodes.new(type='CompositorNodeRLayers')
+    composite_node = tree.nodes.new(type='CompositorNodeComposite')
+    viewer_node = tree.nodes.new(type='CompositorNodeViewer')
+    if hasattr(viewer_node, 'use_alpha'):
+        viewer_node.use_alpha = True # Keep transparency (option removed in newer Blender, alpha is always kept there)
+    composite_node.location = (300, 100)
+    viewer_node.location = (300, -100)
+    tree.links.new(render_layers_node.outputs['Image'], composite_node.inputs['Image'])
+    tree.links.new(render_layers_node.outputs['Image'], viewer_node.inputs['Image'])
+    tree.nodes.active = viewer_node
+
+def save_upscaled_render(scene, filepath, target_resolution):
+    """Upscales the last render (via the Viewer node) with Nearest Neighbor and writes it to filepath.
+       Returns True on success.
     """
-    print(f"DEBUG: Setting up camera for target: {target_object.name}")
+    viewer_image = bpy.data.images.get('Viewer Node')
+    if not viewer_image:
+        print("ERROR (save_upscaled_render): Viewer Node image not found. Was the compositor set up?")
+        return False
+    width, height = viewer_image.size
+    if not width or not height:
+        print("ERROR (save_upscaled_render): Viewer Node image is empty.")
+        return False
+
+    pixels = np.empty(width * height * 4, dtype=np.float32)
+    viewer_image.pixels.foreach_get(pixels)
+    pixels = pixels.reshape(height, width, 4)
+    if target_resolution % width == 0 and target_resolution % height == 0:
+        # Integer factor (e.g. 128 -> 1024): repeat rows then columns, contiguous block copies instead of gathers
+        upscaled = pixels.repeat(target_resolution // height, axis=0).repeat(target_resolution // width, axis=1)
+    else:
+        # Nearest Neighbor: map every target row/column back to the source pixel it falls in
+        rows = np.arange(target_resolution) * height // target_resolution
+        cols = np.arange(target_resolution) * width // target_resolution
+        upscaled = pixels[rows][:, cols]
+
+    # Reuse one float image for all frames; save_render applies the scene's color management and image settings
+    upscale_image = bpy.data.images.get('SpriteUpscale')
+    if upscale_image is None or tuple(upscale_image.size) != (target_resolution, target_resolution):
+        upscale_image = bpy.data.images.new('SpriteUpscale', target_resolution, target_resolution, alpha=True, float_buffer=True)
+    upscale_image.pixels.foreach_set(upscaled.ravel())
+    upscale_image.save_render(filepath, scene=scene)
+    if VERBOSE:
+        print(f"DEBUG (save_upscaled_render): Wrote {width}x{height} render upscaled to {target_resolution}x{target_resolution}: {filepath}")
+    return True
+
+def get_camera_framing(target_object, anim_min=None, anim_max=None, fallback_frame=1):
+    """Works out where the camera should look and how wide it should see: returns (center, ortho_scale, bounds_source).
+       Uses overall animation bounds if provided, otherwise falls back to the bounds at fallback_frame (the first
+       rendered frame).
+       Independent of the viewing angle, so it's computed once and shared by every angle's setup_camera call.
+    """
+    print(f"DEBUG: Determining camera framing for target: {target_object.name}")
     print(f"DEBUG: Target object initial world location: {target_object.location}")
     # print(f"DEBUG: Target object world matrix:\n{target_object.matrix_world}") # Can be verbose
 
-    # --- Determine Center and Dimensions (Animation Bounds or Frame 1 Fallback) ---
+    # --- Determine Center and Dimensions (Animation Bounds or First Frame Fallback) ---
     cam_world_center = mathutils.Vector((0.0, 0.0, 0.0))
     cam_world_dims = mathutils.Vector((1.0, 1.0, 1.0)) # Default size
     bounds_source = "Default"
@@ -203,36 +415,29 @@ def setup_camera(target_object, angle_degrees, anim_min=None, anim_max=None):
         print(f"DEBUG: Animation Center: {cam_world_center}")
         print(f"DEBUG: Animation Dimensions: {cam_world_dims}")
     else:
-        # Fallback to Frame 1 bounds
-        print("DEBUG: No animation bounds provided or calc failed. Falling back to Frame 1 bounds.")
-        bounds_source = "Frame 1"
+        # Fallback to the first rendered frame's bounds
+        print(f"DEBUG: No animation bounds provided or calc failed. Falling back to frame {fallback_frame} bounds.")
+        bounds_source = f"Frame {fallback_frame}"
         try:
             scene = bpy.context.scene
             original_frame = scene.frame_current
-            scene.frame_set(1) 
+            scene.frame_set(fallback_frame)
             
-            frame1_world_dims = get_object_world_dimensions(target_object)
-            if frame1_world_dims:
-                frame1_bbox_corners = [(target_object.matrix_world @ mathutils.Vector(corner)) for corner in target_object.bound_box]
-                if frame1_bbox_corners:
-                    min_coord = mathutils.Vector((min(v[i] for v in frame1_bbox_corners) for i in range(3)))
-                    max_coord = mathutils.Vector((max(v[i] for v in frame1_bbox_corners) for i in range(3)))
-                    cam_world_center = (min_coord + max_coord) / 2.0
-                    cam_world_dims = frame1_world_dims # Use calculated dims
-                    print(f"DEBUG: Calculated Frame 1 Center: {cam_world_center}")
-                    print(f"DEBUG: Calculated Frame 1 Dimensions: {cam_world_dims}")
-                else:
-                     print("DEBUG: Could not get Frame 1 corners, using object origin/default dims.")
-                     cam_world_center = target_object.matrix_world.translation
-                     cam_world_dims = mathutils.Vector((2,2,2))
+            # One corner transform gives both the center and the dimensions
+            min_coord, max_coord = get_object_world_bounds(target_object)
+            if min_coord is not None:
+                cam_world_center = (min_coord + max_coord) / 2.0
+                cam_world_dims = max_coord - min_coord
+                print(f"DEBUG: Calculated {bounds_source} Center: {cam_world_center}")
+                print(f"DEBUG: Calculated {bounds_source} Dimensions: {cam_world_dims}")
             else:
-                 print("DEBUG: Could not get Frame 1 dims, using object origin/default dims.")
+                 print(f"DEBUG: Could not get {bounds_source} dims, using object origin/default dims.")
                  cam_world_center = target_object.matrix_world.translation
                  cam_world_dims = mathutils.Vector((2,2,2))
                  
             scene.frame_set(original_frame)
         except Exception as e_fc:
-             print(f"Error getting Frame 1 center/dims: {e_fc}. Using object origin/default dims.")
+             print(f"Error getting {bounds_source} center/dims: {e_fc}. Using object origin/default dims.")
              cam_world_center = target_object.matrix_world.translation # Fallback
              cam_world_dims = mathutils.Vector((2,2,2))
     # --- End Determine Center & Dimensions ---
@@ -271,6 +476,11 @@ def setup_camera(target_object, angle_degrees, anim_min=None, anim_max=None):
         print(f"Error calculating ortho_scale from {bounds_source} dims: {e}. Using default 5.")
         # calculated_ortho_scale remains 5.0
     # --- End Determine Orthographic Scale ---
+    return cam_world_center, calculated_ortho_scale, bounds_source
+
+def setup_camera(angle_degrees, framing):
+    """Creates and positions an orthographic camera rotated around the framing center from get_camera_framing."""
+    cam_world_center, calculated_ortho_scale, bounds_source = framing
 
     # --- Create and Position Camera (Relative to Calculated Center: cam_world_center) ---
     camera_distance_multiplier = 2.5 
@@ -287,10 +497,10 @@ def setup_camera(target_object, angle_degrees, anim_min=None, anim_max=None):
     camera_location = cam_world_center + rotated_offset 
     print(f"DEBUG: Setting camera angle={angle_degrees} deg, location={camera_location} (relative to {bounds_source} center)")
 
-    bpy.ops.object.camera_add(location=camera_location)
-    camera_obj = bpy.context.object
-    camera = camera_obj.data
-    camera.name = "SpriteRenderCam"
+    camera = bpy.data.cameras.new("SpriteRenderCam")
+    camera_obj = bpy.data.objects.new("SpriteRenderCam", camera)
+    camera_obj.location = camera_location
+    bpy.context.scene.collection.objects.link(camera_obj)
     camera.type = 'ORTHO'
     camera.ortho_scale = calculated_ortho_scale 
 
@@ -308,6 +518,37 @@ def setup_camera(target_object, angle_degrees, anim_min=None, anim_max=None):
     bpy.context.scene.camera = camera_obj
     return camera_obj
 
+def find_shader_output(nodes):
+    """The Material Output node: by its default name, else the first OUTPUT_MATERIAL node (renamed on import)."""
+    return nodes.get("Material Output") or next((node for node in nodes if node.type == 'OUTPUT_MATERIAL'), None)
+
+def find_surface_and_color(material):
+    """Locates the Material Output node, the link feeding its Surface input and the original shader's Base Color link.
+       Returns (output_node, surface_link, shader_node, color_link) or None if there is no linked Surface to rewire."""
+    output_node = find_shader_output(material.node_tree.nodes)
+    if not output_node:
+         print(f"DEBUG: No Material Output node found in {material.name}. Skipping.")
+         return None
+
+    # Find the node connected to the output node's Surface input
+    surface_input = output_node.inputs.get('Surface')
+    if not (surface_input and surface_input.is_linked):
+         print(f"DEBUG: Material Output 'Surface' input not linked in {material.name}. Skipping shader replacement.")
+         return None
+    original_surface_link = surface_input.links[0]
+    original_shader_node = original_surface_link.from_node
+    debug_print(f"DEBUG: Found original shader node '{original_shader_node.name}' connected to Surface.")
+
+    # Try to find the original Base Color input link on the original shader
+    original_color_input_link = None
+    base_color_input = original_shader_node.inputs.get('Base Color')
+    if base_color_input and base_color_input.is_linked:
+        original_color_input_link = base_color_input.links[0]
+        debug_print(f"DEBUG: Found original Base Color link from node '{original_color_input_link.from_node.name}'")
+    else:
+         debug_print(f"DEBUG: No linked Base Color input found on '{original_shader_node.name}'")
+    return output_node, original_surface_link, original_shader_node, original_color_input_link
+
 def apply_toon_bsdf_nodes(material):
     """Modifies a material node tree to apply a basic cel-shading effect using Toon BSDF."""
     if not material or not material.use_nodes:
@@ -318,40 +559,10 @@ def apply_toon_bsdf_nodes(material):
     nodes = material.node_tree.nodes
     links = material.node_tree.links
 
-    # Find the Material Output node
-    output_node = nodes.get("Material Output") # More robust way to get it
-    if not output_node:
-        # Fallback search if name isn't default
-        for node in nodes:
-            if node.type == 'OUTPUT_MATERIAL':
-                output_node = node
-                break
-        if not output_node:
-             print(f"DEBUG: No Material Output node found in {material.name}. Skipping.")
-             return
-
-    # Find the node connected to the output node's Surface input
-    surface_input = output_node.inputs.get('Surface')
-    original_shader_node = None
-    original_color_input_link = None
-    original_surface_link = None
-
-    if surface_input and surface_input.is_linked:
-        original_surface_link = surface_input.links[0]
-        original_shader_node = original_surface_link.from_node
-        print(f"DEBUG: Found original shader node '{original_shader_node.name}' connected to Surface.")
-        
-        # Try to find the original Base Color input link on the original shader
-        base_color_input = original_shader_node.inputs.get('Base Color')
-        if base_color_input and base_color_input.is_linked:
-            original_color_input_link = base_color_input.links[0]
-            print(f"DEBUG: Found original Base Color link from node '{original_color_input_link.from_node.name}'")
-        else:
-             print(f"DEBUG: No linked Base Color input found on '{original_shader_node.name}'")
-    else:
-         print(f"DEBUG: Material Output 'Surface' input not linked in {material.name}. Cannot apply Toon BSDF intelligently.")
-         # Optionally, could still create a default Toon BSDF, but might look bad
-         return
+    found = find_surface_and_color(material)
+    if not found:
+        return
+    output_node, original_surface_link, original_shader_node, original_color_input_link = found
 
     # --- Create and Configure Toon BSDF --- 
     toon_node = nodes.new(type='ShaderNodeBsdfToon')
@@ -360,7 +571,7 @@ def apply_toon_bsdf_nodes(material):
     # Configure Toon BSDF (optional - adjust Smoothness, etc.)
     toon_node.inputs['Smooth'].default_value = 0.05 # Sharper cutoff
     toon_node.component = 'DIFFUSE' # Or 'GLOSSY' or combined
-    print(f"DEBUG: Created Toon BSDF node for {material.name}")
+    debug_print(f"DEBUG: Created Toon BSDF node for {material.name}")
 
     # --- Reconnect Nodes ---
     # 1. Connect original Base Color source to Toon BSDF Color input (if found)
@@ -368,20 +579,20 @@ def apply_toon_bsdf_nodes(material):
         try:
             # Link from the original source node/socket to the Toon node's color input
             links.new(original_color_input_link.from_socket, toon_node.inputs['Color'])
-            print("DEBUG: Linked original Base Color source to Toon BSDF Color.")
+            debug_print("DEBUG: Linked original Base Color source to Toon BSDF Color.")
         except Exception as e:
             print(f"DEBUG: Error linking original Base Color to Toon BSDF: {e}")
             # Fallback: Set default color? Toon node defaults to greyish.
     else:
         # If no original color link, leave Toon BSDF color as default (or set one)
         # toon_node.inputs['Color'].default_value = (0.8, 0.8, 0.8, 1.0) # Example default
-        print("DEBUG: Using default color for Toon BSDF.")
+        debug_print("DEBUG: Using default color for Toon BSDF.")
 
     # 2. Disconnect original shader from Material Output Surface
     if original_surface_link:
         try:
             links.remove(original_surface_link)
-            print("DEBUG: Disconnected original shader from Material Output.")
+            debug_print("DEBUG: Disconnected original shader from Material Output.")
         except Exception as e:
             print(f"DEBUG: Error removing original surface link: {e}")
             # May already be disconnected if Base Color link failed badly?
@@ -389,7 +600,7 @@ def apply_toon_bsdf_nodes(material):
     # 3. Connect Toon BSDF output to Material Output Surface
     try:
         links.new(toon_node.outputs['BSDF'], output_node.inputs['Surface'])
-        print("DEBUG: Connected Toon BSDF to Material Output.")
+        debug_print("DEBUG: Connected Toon BSDF to Material Output.")
     except Exception as e:
         print(f"DEBUG: Error connecting Toon BSDF to Material Output: {e}")
         # If this fails, the material will likely be broken.
@@ -404,53 +615,159 @@ def apply_unlit_shader_nodes(material):
     nodes = material.node_tree.nodes
     links = material.node_tree.links
 
-    output_node = nodes.get("Material Output")
-    if not output_node: # Fallback search
-        for node in nodes: 
-            if node.type == 'OUTPUT_MATERIAL': output_node = node; break
-        if not output_node: print(f"DEBUG: No Material Output node found in {material.name}. Skipping."); return
+    found = find_surface_and_color(material)
+    if not found:
+        return
+    output_node, original_surface_link, original_shader_node, original_color_input_link = found
 
-    surface_input = output_node.inputs.get('Surface')
-    original_shader_node = None
-    original_color_input_link = None
-    original_surface_link = None
-
-    if surface_input and surface_input.is_linked:
-        original_surface_link = surface_input.links[0]
-        original_shader_node = original_surface_link.from_node
-        print(f"DEBUG: Found original shader node '{original_shader_node.name}' connected to Surface.")
-        base_color_input = original_shader_node.inputs.get('Base Color')
-        if base_color_input and base_color_input.is_linked:
-            original_color_input_link = base_color_input.links[0]
-            print(f"DEBUG: Found original Base Color link from node '{original_color_input_link.from_node.name}'")
-        else: print(f"DEBUG: No linked Base Color input found on '{original_shader_node.name}'")
-    else: print(f"DEBUG: Material Output 'Surface' input not linked in {material.name}. Cannot apply unlit shader intelligently."); return
-    
     # --- Create Emission Shader ---
     emission_node = nodes.new(type='ShaderNodeEmission')
     emission_node.location = (original_shader_node.location.x + 200, original_shader_node.location.y)
-    print(f"DEBUG: Created Emission node for {material.name}")
+    debug_print(f"DEBUG: Created Emission node for {material.name}")
 
     # --- Reconnect Nodes ---
     # 1. Connect original Base Color source to Emission Color input (if found)
     if original_color_input_link:
         try:
             links.new(original_color_input_link.from_socket, emission_node.inputs['Color'])
-            print("DEBUG: Linked original Base Color source to Emission Color.")
+            debug_print("DEBUG: Linked original Base Color source to Emission Color.")
         except Exception as e: print(f"DEBUG: Error linking original Base Color to Emission: {e}")
-    else: print("DEBUG: Using default color for Emission.")
+    else: debug_print("DEBUG: Using default color for Emission.")
 
     # 2. Disconnect original shader from Material Output Surface
     if original_surface_link: 
-        try: links.remove(original_surface_link); print("DEBUG: Disconnected original shader from Material Output.")
+        try: links.remove(original_surface_link); debug_print("DEBUG: Disconnected original shader from Material Output.")
         except Exception as e: print(f"DEBUG: Error removing original surface link: {e}")
 
     # 3. Connect Emission output to Material Output Surface
     try:
         links.new(emission_node.outputs['Emission'], output_node.inputs['Surface'])
-        print("DEBUG: Connected Emission to Material Output.")
+        debug_print("DEBUG: Connected Emission to Material Output.")
     except Exception as e: print(f"DEBUG: Error connecting Emission to Material Output: {e}")
 
+def rna_value(value):
+    """A property/socket value as a hashable: arrays (also nested, e.g. matrices) -> tuples, enum flag sets -> sorted
+    tuples, ID pointers (images, node groups, ...) -> their name. Other struct pointers can't be compared by
+    value, so they map to their own address: a material holding one never matches another material."""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, bpy.types.ID):
+        return ('ID', type(value).__name__, value.name)
+    if hasattr(value, 'bl_rna'):
+        return ('struct', value.as_pointer())
+    if isinstance(value, (set, frozenset)): # Enum flags
+        return tuple(sorted(value))
+    try:
+        items = iter(value)
+    except TypeError:
+        # Not an array: a hashable scalar is kept as is, anything else can't be compared
+        try:
+            hash(value)
+        except TypeError:
+            return ('unhashable', id(value))
+        return value
+    return tuple(rna_value(item) for item in items)
+
+def socket_value(socket):
+    """An input socket's unlinked default value as a hashable; None for sockets without one."""
+    return rna_value(getattr(socket, 'default_value', None))
+
+# Node properties that only affect the node editor, not what the material renders
+NODE_UI_PROPS = frozenset({'rna_type', 'name', 'label', 'location', 'location_absolute', 'width', 'width_hidden',
+                           'height', 'dimensions', 'select', 'show_options', 'show_preview', 'show_texture', 'hide',
+                           'color', 'use_custom_color', 'parent', 'warning_propagation', 'color_tag', 'bl_idname',
+                           'bl_label', 'bl_description', 'bl_icon', 'bl_static_type', 'bl_width_default',
+                           'bl_width_min', 'bl_width_max', 'bl_height_default', 'bl_height_min', 'bl_height_max',
+                           'type', 'internal_links', 'inputs', 'outputs'})
+# Material-level settings that change how it renders (looked up with getattr: some only exist in some Blender versions)
+MATERIAL_RENDER_PROPS = ('diffuse_color', 'blend_method', 'surface_render_method', 'shadow_method', 'alpha_threshold',
+                         'use_backface_culling', 'use_transparency_overlap', 'use_screen_refraction', 'displacement_method')
+
+def node_settings(node):
+    """Hashable (identifier, value) pairs of a node's non-socket properties: operation/blend_type, image and its
+    interpolation/extension/projection, uv_map, space, ColorRamp elements, ..."""
+    settings = []
+    for prop in node.bl_rna.properties:
+        identifier = prop.identifier
+        if identifier in NODE_UI_PROPS or prop.type == 'COLLECTION':
+            continue
+        value = getattr(node, identifier, None)
+        if identifier == 'color_ramp' and value is not None:
+            value = (value.interpolation, value.color_mode,
+                     tuple((element.position, tuple(element.color)) for element in value.elements))
+        elif identifier == 'mapping' and value is not None: # RGB/vector curves
+            value = tuple(tuple((point.location[0], point.location[1]) for point in curve.points) for curve in value.curves)
+        else:
+            value = rna_value(value)
+        settings.append((identifier, value))
+    return tuple(settings)
+
+def material_base_name(material):
+    """Name without Blender's .NNN duplicate suffix ('Skin.002' -> 'Skin')."""
+    base, dot, suffix = material.name.rpartition('.')
+    return base if dot and suffix.isdigit() else material.name
+
+def material_signature(material):
+    """Hashable description of everything a material renders from: its base name, material-level render settings,
+    each node's type, settings, images and unlinked input values, and the links. Only .NNN copies of the same
+    material (FBX per-submesh duplicates) can share a signature, and only when all of that is identical."""
+    settings = tuple(rna_value(getattr(material, prop, None)) for prop in MATERIAL_RENDER_PROPS)
+    if not material.use_nodes:
+        return (material_base_name(material), settings, None)
+    node_tree = material.node_tree
+    nodes = tuple(sorted(
+        (node.name, node.bl_idname, node_settings(node),
+         tuple(socket_value(inp) for inp in node.inputs if not inp.is_linked))
+        for node in node_tree.nodes))
+    links = tuple(sorted(
+        (link.from_node.name, link.from_socket.identifier, link.to_node.name, link.to_socket.identifier)
+        for link in node_tree.links))
+    return (material_base_name(material), settings, nodes, links)
+
+def merge_duplicate_materials(mesh_objects, materials):
+    """Points every slot at one canonical material per signature, so the style's shader pass rewrites each
+    distinct material once. Returns the canonical materials in name order. If a signature can't be built,
+    nothing is merged: the materials are only styled one by one, which is slower but renders the same."""
+    canonical = {}
+    remap = {}
+    try:
+        for mat in sorted(materials, key=lambda m: m.name): # Lowest name (the un-suffixed original) wins
+            remap[mat] = canonical.setdefault(material_signature(mat), mat)
+    except Exception as e:
+        print(f"Warning: Could not compare materials ({e}), leaving them unmerged.")
+        return list(materials)
+    for obj in mesh_objects:
+        for slot in obj.material_slots:
+            if slot.material and remap[slot.material] is not slot.material:
+                slot.material = remap[slot.material]
+    merged = list(canonical.values())
+    if len(merged) < len(materials):
+        print(f"DEBUG: Merged {len(materials)} materials into {len(merged)} distinct ones: {[m.name for m in merged]}")
+    return merged
+
+def apply_blueprint_material(material):
+    """Unlit base with the emission color forced to white, so the Freestyle lines sit on white fills."""
+    print(f"--- DEBUG (render_animation): ENTERING BLUEPRINT MATERIAL SETUP for {material.name} ---") # Added Debug
+    apply_unlit_shader_nodes(material) # Apply base unlit setup first
+    # Explicitly set emission color to white
+    try:
+        emission_node = material.node_tree.nodes.get("Emission")
+        if emission_node and 'Color' in emission_node.inputs:
+            emission_node.inputs['Color'].default_value = (1.0, 1.0, 1.0, 1.0) # White
+            print(f"DEBUG: Set Blueprint emission color to WHITE for {material.name}")
+        else:
+            print(f"Warning: Could not find Emission node or Color input for Blueprint style on {material.name}")
+    except Exception as e_bp_mat:
+        print(f"Warning: Error setting Blueprint emission color for {material.name}: {e_bp_mat}")
+
+def get_or_create_material(name, setup):
+    """Returns the material called name, creating it and running setup(material) on its node tree if it doesn't exist."""
+    material = bpy.data.materials.get(name)
+    if material is None:
+        material = bpy.data.materials.new(name=name)
+        setup(material)
+    return material
+
 def apply_wireframe_material(material):
     """Replaces the material node tree with a simple wireframe setup."""
     if not material or not material.use_nodes:
@@ -460,7 +777,7 @@ def apply_wireframe_material(material):
     nodes = material.node_tree.nodes
     links = material.node_tree.links
     # Clear existing nodes
-    for node in nodes: nodes.remove(node)
+    nodes.clear()
     
     # Create new nodes
     output_node = nodes.new(type='ShaderNodeOutputMaterial')
@@ -489,7 +806,7 @@ def apply_clay_material(material):
     nodes = material.node_tree.nodes
     links = material.node_tree.links
     # Clear existing nodes
-    for node in nodes: nodes.remove(node)
+    nodes.clear()
 
     # Create new nodes
     output_node = nodes.new(type='ShaderNodeOutputMaterial')
@@ -510,7 +827,7 @@ def create_outline_material():
         outline_mat.use_nodes = True
         nodes = outline_mat.node_tree.nodes
         links = outline_mat.node_tree.links
-        for node in nodes: nodes.remove(node) # Clear default nodes
+        nodes.clear() # Clear default nodes
 
         output_node = nodes.new(type='ShaderNodeOutputMaterial')
         emission_node = nodes.new(type='ShaderNodeEmission')
@@ -534,15 +851,13 @@ def apply_outline_modifier(obj, outline_material, thickness=-0.005):
     print(f"DEBUG: Applying outline modifier to mesh object: {obj.name}")
     
     # Add new material slot if needed and assign outline material
-    if outline_material.name not in obj.material_slots:
+    outline_slot_index = obj.material_slots.find(outline_material.name)
+    if outline_slot_index == -1:
         obj.data.materials.append(outline_material)
+        outline_slot_index = len(obj.data.materials) - 1 # Just appended, so it's the last slot: no second search
         print(f"DEBUG: Added outline material slot to {obj.name}")
     else:
         print(f"DEBUG: Outline material slot already exists on {obj.name}")
-    outline_slot_index = obj.material_slots.find(outline_material.name)
-    if outline_slot_index == -1:
-        print(f"ERROR: Could not find outline material slot index on {obj.name} after adding it!")
-        return # Should not happen
     
     # Add Solidify Modifier
     mod_name = "OutlineSolidify"
@@ -561,10 +876,10 @@ def apply_outline_modifier(obj, outline_material, thickness=-0.005):
     solidify_mod.use_rim = False 
     print(f"DEBUG: Configured Solidify modifier for {obj.name} with thickness {thickness}")
 
-def render_animation(fbx_path, output_dir, output_name, num_frames_to_render, angle_degrees, render_style, output_format, pixel_resolution=None):
-    """Imports FBX, sets up scene/camera/style/format, and renders animation frames."""
-    print(f"--- DEBUG (render_animation): Received render_style = '{render_style}'") # Added Debug
-    setup_scene(render_style, output_format, pixel_resolution)
+def prepare_scene(fbx_path, render_style, output_format, pixel_resolution=None, upscale_resolution=None):
+    """Sets up the scene, imports the FBX and applies the style's materials/modifiers. Everything except camera and rendering."""
+    print(f"--- DEBUG (prepare_scene): Received render_style = '{render_style}'") # Added Debug
+    setup_scene(render_style, output_format, pixel_resolution, upscale_resolution)
 
     try:
         bpy.ops.import_scene.fbx(filepath=fbx_path)
@@ -584,68 +899,20 @@ def render_animation(fbx_path, output_dir, output_name, num_frames_to_render, an
         print("Error: Could not find suitable object (Armature/Mesh) in imported FBX.")
         sys.exit(1)
 
-    # Ensure object is selected and active
-    bpy.context.view_layer.objects.active = imported_object
-    imported_object.select_set(True)
-
-    # --- Get Animation Range ---
-    scene = bpy.context.scene
-    start_frame = 1
-    end_frame = 1
-    action = None
-    if imported_object.animation_data and imported_object.animation_data.action:
-        action = imported_object.animation_data.action
-        start_frame = int(action.frame_range[0])
-        end_frame = int(action.frame_range[1])
-        scene.frame_start = start_frame
-        scene.frame_end = end_frame
-        print(f"Found animation: '{action.name}'. Frames: {start_frame} to {end_frame}")
-    else:
-        print("Warning: No animation data found on the primary object. Will use frame 1 bounds.")
-    # --- End Get Animation Range ---
-    
-    # --- Calculate Overall Animation Bounds (if animation exists) ---
-    overall_min = None
-    overall_max = None
-    if action and end_frame > start_frame: # Only calculate if there's an animation > 1 frame
-        print("Attempting to calculate overall animation bounds...")
-        overall_min, overall_max = get_animation_world_bounds(imported_object, start_frame, end_frame)
-        if overall_min and overall_max:
-             print(f"Successfully calculated animation bounds: Min={overall_min}, Max={overall_max}")
-        else:
-             print("Failed to calculate overall animation bounds, will fall back to frame 1.")
-    # --- End Calculate Overall Animation Bounds ---
-
-    # Setup camera targeting the imported object, passing angle and optional animation bounds
-    setup_camera(imported_object, angle_degrees, anim_min=overall_min, anim_max=overall_max)
-
-    # Determine frames to render (Original logic moved after camera setup)
-    frames_to_render = []
-    total_source_frames = end_frame - start_frame + 1
-
-    if total_source_frames <= 1 or num_frames_to_render <= 1:
-        frames_to_render.append(start_frame) # Render only the start frame
-        print(f"Rendering single frame: {start_frame}")
-    else:
-        # Ensure num_frames_to_render is not more than available frames
-        num_frames_to_render = min(num_frames_to_render, total_source_frames)
-        print(f"Calculating {num_frames_to_render} frames between {start_frame} and {end_frame}")
-        # Calculate step, ensuring float division
-        step = float(total_source_frames -1) / (num_frames_to_render - 1)
-        for i in range(num_frames_to_render):
-             current_frame = int(round(start_frame + i * step))
-             # Clamp frame number just in case of rounding issues
-             current_frame = max(start_frame, min(end_frame, current_frame))
-             frames_to_render.append(current_frame)
-        # Remove duplicates if rounding causes them, though unlikely with this method
-        frames_to_render = sorted(list(set(frames_to_render)))
-        print(f"Frames to render: {frames_to_render}")
-
+    # No selection/active object needed: everything after the import works on the data directly
     # --- Create Outline Material (if needed) ---
     outline_material_instance = None
-    if render_style in ['cel_outline', 'cel_thicker_outline', 'pixel_outline']: # Add pixel_outline
+    if render_style in OUTLINE_MODIFIER_STYLES:
         outline_material_instance = create_outline_material()
     # --- End Create Outline Material ---
+
+    # --- Create Override Material (clay/wireframe), once for all objects ---
+    override_material = None
+    if render_style == 'clay':
+        override_material = get_or_create_material("ClayMaterial", apply_clay_material) # Diffuse-only clay look
+    elif render_style == 'wireframe':
+        override_material = get_or_create_material("WireframeMaterial", apply_wireframe_material)
+    # --- End Create Override Material ---
     
     # --- Apply Shaders / Modifiers based on Style ---
     if imported_object:
@@ -660,67 +927,31 @@ def render_animation(fbx_path, output_dir, output_name, num_frames_to_render, an
              # Only process mesh children if main object isn't a mesh itself
              objects_to_process.extend(child for child in imported_object.children if child.type == 'MESH') 
 
-        # Remove duplicates and ensure we only process MESH objects for modifiers/materials
-        mesh_objects_to_process = list({obj for obj in objects_to_process if obj.type == 'MESH'})
+        # Remove duplicates (keeping order, so materials/modifiers are applied the same way every run)
+        # and ensure we only process MESH objects for modifiers/materials
+        mesh_objects_to_process = list(dict.fromkeys(obj for obj in objects_to_process if obj.type == 'MESH'))
         print(f"DEBUG: Found MESH objects to process: {[obj.name for obj in mesh_objects_to_process]}")
 
         # Process Materials FIRST (unless clay/wireframe)
-        if render_style not in ['clay', 'wireframe']:
-            all_materials = set()
-            for obj in mesh_objects_to_process:
-                for slot in obj.material_slots: 
-                    if slot.material: all_materials.add(slot.material)
+        if render_style not in MATERIAL_OVERRIDE_STYLES:
+            # One pass over the slots; dict keeps first-seen order (a set of bpy structs iterates in pointer order)
+            all_materials = list(dict.fromkeys(
+                slot.material for obj in mesh_objects_to_process for slot in obj.material_slots if slot.material))
             
             print(f"DEBUG: Found materials for style '{render_style}': {[m.name for m in all_materials]}")
-            for mat in all_materials:
-                  # --- Restore original material-based style logic ---
-                  if render_style in ['cel', 'cel_outline', 'cel_thicker_outline']:
-                      # For outline styles, we want unlit original colors + an outline modifier later
-                      apply_unlit_shader_nodes(mat) 
-                      print(f"DEBUG: Applying UNLIT (Emission) nodes for selected style '{render_style}' to {mat.name}")
-                  elif render_style == 'unlit':
-                      # For plain unlit, we apply unlit shader nodes
-                      apply_unlit_shader_nodes(mat)
-                      print(f"DEBUG: Applying UNLIT (Emission) nodes for selected style '{render_style}' to {mat.name}")
-                      # apply_toon_bsdf_nodes(mat) # This was likely incorrect for 'unlit'
-                  elif render_style == 'original_unlit':
-                      # Leave material as is (it's already unlit if imported correctly)
-                      print(f"DEBUG: Using original material for 'original_unlit' style for {mat.name}")
-                  elif render_style in ['pixel_cel', 'pixel_outline', 'pixel_post_outline', 'pixel_post_thin_outline']:
-                      # Treat pixel_post_outline and pixel_post_thin_outline the same as pixel_cel for Blender
-                      if render_style in ['pixel_post_outline', 'pixel_post_thin_outline']:
-                          print(f"DEBUG: Treating '{render_style}' as 'pixel_cel' for Blender rendering.")
-                      # Use unlit for pixelated base colors
-                      apply_unlit_shader_nodes(mat)
-                      print(f"DEBUG: Applying UNLIT (Emission) nodes for selected style '{render_style}' to {mat.name}")
-                  # --- Blueprint Material Handling (Correct Location) ---
-                  elif render_style == 'blueprint':
-                      print(f"--- DEBUG (render_animation): ENTERING BLUEPRINT MATERIAL SETUP for {mat.name} ---") # Added Debug
-                      apply_unlit_shader_nodes(mat) # Apply base unlit setup first
-                      # Explicitly set emission color to white
-                      try:
-                          emission_node = mat.node_tree.nodes.get("Emission")
-                          if emission_node and 'Color' in emission_node.inputs:
-                              emission_node.inputs['Color'].default_value = (1.0, 1.0, 1.0, 1.0) # White
-                              print(f"DEBUG: Set Blueprint emission color to WHITE for {mat.name}")
-                          else:
-                              print(f"Warning: Could not find Emission node or Color input for Blueprint style on {mat.name}")
-                      except Exception as e_bp_mat:
-                          print(f"Warning: Error setting Blueprint emission color for {mat.name}: {e_bp_mat}")
-                  # ---------------------------------------------------
-                  elif render_style == 'halftone': # Placeholder
-                      apply_halftone_dots_nodes(mat)
-                      print(f"DEBUG: Applying HALFTONE placeholder to {mat.name}")
-                  elif render_style == 'hatched': # Placeholder
-                       apply_toon_bsdf_nodes(mat) # Use Toon as base
-                       print(f"DEBUG: Applying HATCHED placeholder (Toon) to {mat.name}")
-                  elif render_style == 'glitch': # Placeholder
-                       apply_unlit_shader_nodes(mat) # Unlit base
-                       print(f"DEBUG: Applying GLITCH placeholder (Unlit) to {mat.name}")
-                  elif render_style == 'ascii_art': # Placeholder
-                       apply_high_contrast_nodes(mat)
-                       print(f"DEBUG: Applying ASCII_ART placeholder (High Contrast) to {mat.name}")
-                  # else 'bright': do nothing to material nodes here, lighting is handled
+            if render_style in STYLE_MATERIAL_HANDLERS:
+                all_materials = merge_duplicate_materials(mesh_objects_to_process, all_materials)
+            # Handler resolved once for the style instead of re-running the style checks per material
+            if render_style in POST_OUTLINE_STYLES:
+                print(f"DEBUG: Treating '{render_style}' as 'pixel_cel' for Blender rendering.")
+            material_handler = STYLE_MATERIAL_HANDLERS.get(render_style)
+            if material_handler:
+                print(f"DEBUG: Applying {material_handler.__name__} for style '{render_style}' to {len(all_materials)} materials")
+                for mat in all_materials:
+                    material_handler(mat)
+            else:
+                # 'bright': lighting is handled by setup_scene; 'original_unlit': materials are used as imported
+                print(f"DEBUG: Keeping original materials for style '{render_style}'")
 
         # Process Modifiers / Full Material Overrides (Clay, Wireframe, Outlines)
         for obj in mesh_objects_to_process:
@@ -730,28 +961,22 @@ def render_animation(fbx_path, output_dir, output_name, num_frames_to_render, an
                   apply_outline_modifier(obj, outline_material_instance, thickness=-0.015)
              elif render_style == 'pixel_outline' and outline_material_instance:
                   apply_outline_modifier(obj, outline_material_instance, thickness=-0.015) # Use thicker outline for pixel style too
-             elif render_style == 'clay':
-                  # Clay needs to replace existing materials on the object
+             elif override_material:
+                  # Clay and wireframe replace existing materials on the object
                   if obj.material_slots:
-                      clay_mat = bpy.data.materials.get("ClayMaterial")
-                      if clay_mat is None: # Create if doesn't exist
-                          clay_mat = bpy.data.materials.new(name="ClayMaterial")
-                          apply_clay_material(clay_mat) # This clears nodes and adds diffuse
-                      for slot in obj.material_slots:
-                          slot.material = clay_mat
-                      print(f"DEBUG: Applied clay material override to {obj.name}")
-                  else: print(f"DEBUG: No material slots on {obj.name} to apply clay override.")
-             elif render_style == 'wireframe':
-                  # Wireframe needs to replace existing materials
-                  if obj.material_slots:
-                      wire_mat = bpy.data.materials.get("WireframeMaterial")
-                      if wire_mat is None: # Create if doesn't exist
-                          wire_mat = bpy.data.materials.new(name="WireframeMaterial")
-                          apply_wireframe_material(wire_mat) # This clears nodes and adds wireframe setup
-                      for slot in obj.material_slots:
-                          slot.material = wire_mat
-                      print(f"DEBUG: Applied wireframe material override to {obj.name}")
-                  else: print(f"DEBUG: No material slots on {obj.name} to apply wireframe override.")
+                      if any(slot.link == 'OBJECT' for slot in obj.material_slots):
+                          # Object-linked slots aren't stored on the mesh; set them one by one
+                          for slot in obj.material_slots:
+                              slot.material = override_material
+                      else:
+                          # Collapse to a single slot: one material to compile and one slot write instead of one per slot
+                          mesh = obj.data
+                          mesh.materials.clear()
+                          mesh.materials.append(override_material)
+                          mesh.polygons.foreach_set("material_index", np.zeros(len(mesh.polygons), dtype=np.int32))
+                          mesh.update()
+                      print(f"DEBUG: Applied {override_material.name} override to {obj.name}")
+                  else: print(f"DEBUG: No material slots on {obj.name} to apply {override_material.name} override.")
              # Placeholder logic for object-specific parts of new styles (if any)
              elif render_style == 'halftone': pass
              elif render_style == 'hatched': pass
@@ -763,37 +988,202 @@ def render_animation(fbx_path, output_dir, output_name, num_frames_to_render, an
                   # Default behavior (bright lighting) is already handled by add_sun_light()
 
     # --- End Apply Shader / Modifiers ---
+
+    # Remember the target so a cached .blend can be rendered without re-running the object search
+    bpy.context.scene[TARGET_OBJECT_PROP] = imported_object.name
+    return imported_object
+
+def get_animation_range(obj):
+    """Returns (action, start_frame, end_frame) of the object's animation, or (None, 1, 1) if it has none."""
+    if obj.animation_data and obj.animation_data.action:
+        action = obj.animation_data.action
+        return action, int(action.frame_range[0]), int(action.frame_range[1])
+    return None, 1, 1
+
+def save_prepared_scene(fbx_path, blend_path, render_style, output_format, pixel_resolution=None, upscale_resolution=None,
+                        num_frames_to_render=None):
+    """Prepares the scene once and saves it as a .blend, so each angle can skip the FBX import.
+    The animation bounds are computed here too and stored in the .blend, so render jobs don't each
+    step through the animation (every frame_set re-evaluates the whole scene) to find them again.
+    Single-frame jobs (num_frames_to_render=1) are framed on their one frame and skip that scan."""
+    imported_object = prepare_scene(fbx_path, render_style, output_format, pixel_resolution, upscale_resolution)
+    action, start_frame, end_frame = get_animation_range(imported_object)
+    if action and end_frame > start_frame and (num_frames_to_render is None or num_frames_to_render > 1):
+        overall_min, overall_max = get_animation_world_bounds(imported_object, start_frame, end_frame,
+                                                              stable_samples=BOUNDS_STABLE_SAMPLES)
+        if overall_min and overall_max:
+            bpy.context.scene[ANIM_BOUNDS_PROP] = list(overall_min) + list(overall_max)
+    bpy.ops.wm.save_as_mainfile(filepath=blend_path, check_existing=False)
+    print(f"DEBUG: Saved prepared scene to {blend_path}")
+
+def render_prepared_angles(angle_targets, num_frames_to_render, output_format, upscale_resolution=None, frame_shard=None):
+    """Renders the animation frames of an already prepared scene for each (angle_degrees, output_dir, output_name)
+       in angle_targets. Animation range, bounds and frame selection are computed once and shared by all angles.
+       frame_shard=(index, count) renders only every count-th selected frame starting at index, keeping the
+       frame numbers of the full sequence, so several workers can split one angle's frames between them."""
+    scene = bpy.context.scene
+    imported_object = scene.objects.get(scene.get(TARGET_OBJECT_PROP, ""))
+    if not imported_object:
+        print("Error: Prepared scene has no target object to render.")
+        sys.exit(1)
+    # Upscaling only applies to pixel styles rendered at a low resolution (setup_scene enables the compositor for those)
+    if not scene.use_nodes:
+        upscale_resolution = None
+
+    # --- Get Animation Range ---
+    action, start_frame, end_frame = get_animation_range(imported_object)
+    if action:
+        scene.frame_start = start_frame
+        scene.frame_end = end_frame
+        print(f"Found animation: '{action.name}'. Frames: {start_frame} to {end_frame}")
+    else:
+        print("Warning: No animation data found on the primary object. Will use the first frame's bounds.")
+    # --- End Get Animation Range ---
     
+    # Determine frames to render
+    frames_to_render = []
+    total_source_frames = end_frame - start_frame + 1
+
+    if total_source_frames <= 1 or num_frames_to_render <= 1:
+        frames_to_render.append(start_frame) # Render only the start frame
+        print(f"Rendering single frame: {start_frame}")
+    else:
+        # Ensure num_frames_to_render is not more than available frames
+        num_frames_to_render = min(num_frames_to_render, total_source_frames)
+        print(f"Calculating {num_frames_to_render} frames between {start_frame} and {end_frame}")
+        # Evenly spaced, rounded to whole frames; np.unique sorts and drops any duplicates from rounding
+        frames_to_render = np.unique(np.clip(np.rint(np.linspace(start_frame, end_frame, num_frames_to_render)),
+                                             start_frame, end_frame).astype(int)).tolist()
+        print(f"Frames to render: {frames_to_render}")
+
+    # --- Calculate Overall Animation Bounds (if animation exists) ---
+    # A single rendered frame only needs its own bounds: skip the scan and let get_camera_framing
+    # fall back to the start frame
+    overall_min = None
+    overall_max = None
+    cached_bounds = scene.get(ANIM_BOUNDS_PROP)
+    if len(frames_to_render) <= 1:
+        print(f"Single frame render, framing the camera on frame {start_frame} instead of the whole animation.")
+    elif cached_bounds is not None:
+        # Computed once when the scene was prepared
+        overall_min, overall_max = mathutils.Vector(cached_bounds[:3]), mathutils.Vector(cached_bounds[3:])
+        print(f"Using animation bounds stored in the prepared scene: Min={overall_min}, Max={overall_max}")
+    elif action and end_frame > start_frame: # Only calculate if there's an animation > 1 frame
+        print("Attempting to calculate overall animation bounds...")
+        overall_min, overall_max = get_animation_world_bounds(imported_object, start_frame, end_frame,
+                                                              stable_samples=BOUNDS_STABLE_SAMPLES)
+        if overall_min and overall_max:
+             print(f"Successfully calculated animation bounds: Min={overall_min}, Max={overall_max}")
+        else:
+             print("Failed to calculate overall animation bounds, will fall back to the first frame.")
+    # --- End Calculate Overall Animation Bounds ---
+
+    # (frame_index, frame) pairs this job renders; file numbering always follows the full selection
+    indexed_frames = list(enumerate(frames_to_render))
+    if frame_shard:
+        shard_index, shard_count = frame_shard
+        indexed_frames = indexed_frames[shard_index::shard_count]
+        print(f"Rendering frame shard {shard_index + 1}/{shard_count}: frame indices {[i for i, _ in indexed_frames]}")
+
     # Determine file extension
     file_extension = output_format.lower()
+
+    # Evenly spaced frames written as-is can go through one animation render instead of one render call per frame
+    animation_step = None
+    if not upscale_resolution and len(indexed_frames) > 1:
+        frame_steps = set(np.diff([frame for _, frame in indexed_frames]).tolist())
+        if len(frame_steps) == 1:
+            animation_step = frame_steps.pop()
+            print(f"DEBUG: Frames are evenly spaced (step {animation_step}), rendering each angle as one animation.")
+
+    # Frames only differ by frame_set/camera: keep render data (BVH, shaders) between them and skip interface locking work
+    set_if_changed(scene.render, use_persistent_data=True, use_lock_interface=True)
+
+    # Camera center and scale don't depend on the angle (the frame 1 fallback even needs a frame_set), so work them out once
+    camera_framing = get_camera_framing(imported_object, anim_min=overall_min, anim_max=overall_max, fallback_frame=start_frame)
     
-    # Render the selected frames
-    print(f"Rendering {len(frames_to_render)} frames to {output_dir} with base name {output_name} (Format: {output_format})...")
-    frame_index = 0
-    for frame in frames_to_render:
-        scene.frame_set(frame)
-        # Set filepath WITHOUT extension (Blender adds it based on format)
-        frame_filename_base = f"{output_name}_{frame_index:04d}"
-        scene.render.filepath = os.path.join(output_dir, frame_filename_base)
+    for angle_degrees, output_dir, output_name in angle_targets:
+        os.makedirs(output_dir, exist_ok=True)
+        # Setup camera for this angle around the shared framing
+        camera_obj = setup_camera(angle_degrees, camera_framing)
+
+        # Render the selected frames
+        print(f"Rendering {len(indexed_frames)} frames to {output_dir} with base name {output_name} (Format: {output_format})...")
+        if animation_step:
+            expected_filepaths = render_frames_as_animation(scene, indexed_frames, animation_step, output_dir, output_name, file_extension)
+        else:
+            expected_filepaths = []
+            # Bound once for the loop instead of walking scene.render / bpy.ops.render per frame
+            render_settings = scene.render
+            frame_set = scene.frame_set
+            render_op = bpy.ops.render.render
+            for frame_index, frame in indexed_frames:
+                frame_set(frame)
+                # Set filepath WITHOUT extension (Blender adds it based on format)
+                frame_filepath_base = os.path.join(output_dir, f"{output_name}_{frame_index:04d}")
+                render_settings.filepath = frame_filepath_base
         
-        print(f"--- DEBUG (render_animation): Rendering frame {frame_index} to base path: {scene.render.filepath} with format {scene.render.image_settings.file_format} ---") # Added Debug
+                if VERBOSE:
+                    print(f"--- DEBUG (render_animation): Rendering frame {frame_index} to base path: {frame_filepath_base} with format {render_settings.image_settings.file_format} ---") # Added Debug
         
-        # Render the frame
-        bpy.ops.render.render(write_still=True)
+                expected_filepath = f"{frame_filepath_base}.{file_extension}"
         
-        # --- Verify file existence --- 
-        expected_filepath = f"{scene.render.filepath}.{file_extension}"
-        if os.path.exists(expected_filepath):
-            print(f"DEBUG (render_animation): Verified file exists at: {expected_filepath}")
-        else:
-            print(f"ERROR (render_animation): File NOT found after render at expected path: {expected_filepath}")
+                # Render the frame
+                if upscale_resolution:
+                    # Render without writing, then write once at the upscaled size
+                    render_op(write_still=False)
+                    save_upscaled_render(scene, expected_filepath, upscale_resolution)
+                else:
+                    render_op(write_still=True)
+        
+                expected_filepaths.append(expected_filepath)
+                if VERBOSE:
+                    print(f"DEBUG (render_animation): Frame {frame_index} render complete.")
+
+        # --- Verify file existence (once per angle, not between renders) ---
+        missing_filepaths = [path for path in expected_filepaths if not os.path.exists(path)]
+        for path in missing_filepaths:
+            print(f"ERROR (render_animation): File NOT found after render at expected path: {path}")
+        print(f"DEBUG (render_animation): Verified {len(expected_filepaths) - len(missing_filepaths)}/{len(expected_filepaths)} frames exist in {output_dir}")
         # ---------------------------
-            
-        print(f"DEBUG (render_animation): Frame {frame_index} render complete.")
-        frame_index += 1
+
+        # Drop this angle's camera so the next angle starts from the same prepared scene
+        camera_data = camera_obj.data
+        bpy.data.objects.remove(camera_obj, do_unlink=True)
+        bpy.data.cameras.remove(camera_data)
 
     print("Rendering finished.")
 
+def render_frames_as_animation(scene, indexed_frames, frame_step, output_dir, output_name, file_extension):
+    """Renders evenly spaced (frame_index, frame) pairs with a single animation render, then renames Blender's
+       frame-numbered files to the usual <output_name>_<frame_index>. Returns the expected file paths."""
+    saved_range = (scene.frame_start, scene.frame_end, scene.frame_step)
+    scene.frame_start, scene.frame_end, scene.frame_step = indexed_frames[0][1], indexed_frames[-1][1], frame_step
+    # Hidden temporary names (Blender fills in the frame number) so a partial run never looks like finished frames
+    scene.render.filepath = os.path.join(output_dir, f".{output_name}_frame_######")
+    try:
+        bpy.ops.render.render(animation=True)
+    finally:
+        scene.frame_start, scene.frame_end, scene.frame_step = saved_range
+
+    expected_filepaths = []
+    for frame_index, frame in indexed_frames:
+        rendered_filepath = os.path.join(output_dir, f".{output_name}_frame_{frame:06d}.{file_extension}")
+        expected_filepath = os.path.join(output_dir, f"{output_name}_{frame_index:04d}.{file_extension}")
+        if os.path.exists(rendered_filepath):
+            os.replace(rendered_filepath, expected_filepath)
+        expected_filepaths.append(expected_filepath)
+    return expected_filepaths
+
+def render_prepared_scene(output_dir, output_name, num_frames_to_render, angle_degrees, output_format, upscale_resolution=None):
+    """Adds the camera for one angle to an already prepared scene and renders the animation frames."""
+    render_prepared_angles([(angle_degrees, output_dir, output_name)], num_frames_to_render, output_format, upscale_resolution)
+
+def render_animation(fbx_path, output_dir, output_name, num_frames_to_render, angle_degrees, render_style, output_format, pixel_resolution=None, upscale_resolution=None):
+    """Imports FBX, sets up scene/camera/style/format, and renders animation frames."""
+    prepare_scene(fbx_path, render_style, output_format, pixel_resolution, upscale_resolution)
+    render_prepared_scene(output_dir, output_name, num_frames_to_render, angle_degrees, output_format, upscale_resolution)
+
 # --- Placeholder Functions for New Styles --- 
 def apply_halftone_dots_nodes(material):
     """Placeholder: Modifies material nodes for halftone effect."""
@@ -814,6 +1204,19 @@ def apply_high_contrast_nodes(material):
     except Exception:
         pass # Ignore if nodes don't exist as expected
 
+# Per-material shader pass for each style (defined after the placeholder functions it references).
+# Styles not listed keep their imported materials; clay/wireframe replace materials per object instead.
+STYLE_MATERIAL_HANDLERS = {
+    **dict.fromkeys(CEL_STYLES, apply_unlit_shader_nodes), # Unlit original colors; outline styles add a modifier later
+    'unlit': apply_unlit_shader_nodes,
+    **dict.fromkeys(PIXEL_STYLES, apply_unlit_shader_nodes), # Unlit for pixelated base colors (post-outline styles = pixel_cel)
+    'blueprint': apply_blueprint_material,
+    'halftone': apply_halftone_dots_nodes, # Placeholder
+    'hatched': apply_toon_bsdf_nodes, # Placeholder: Toon as base
+    'glitch': apply_unlit_shader_nodes, # Placeholder: unlit base
+    'ascii_art': apply_high_contrast_nodes, # Placeholder
+}
+
 if __name__ == "__main__":
     # Blender scripts need to parse args after '--'
     argv = sys.argv
@@ -835,10 +1238,24 @@ if __name__ == "__main__":
                         help="Output image format (default: PNG)")
     parser.add_argument("--pixel_resolution", type=int, default=None,
                         help="Target resolution for pixelated style (e.g., 128)")
+    parser.add_argument("--upscale_resolution", type=int, default=None,
+                        help="Upscale pixelated frames to this resolution with Nearest Neighbor before writing (e.g., 1024)")
+    parser.add_argument("--angles", default=None,
+                        help="Comma-separated angles to render in this one run (overrides --angle). "
+                             "Each goes to <output_dir>/angle_<angle>/<output_name>_angle_<angle>_####")
 
     args = parser.parse_args(argv)
 
     # Ensure output directory exists
     os.makedirs(args.output_dir, exist_ok=True)
 
-    render_animation(args.input, args.output_dir, args.output_name, args.num_frames, args.angle, args.render_style, args.output_format, args.pixel_resolution) 
\ No newline at end of file
+    if args.angles:
+        # Import and set up the scene once, then only swap the camera per angle
+        angle_targets = []
+        for angle in (float(a) for a in args.angles.split(',') if a.strip()):
+            angle_str_safe = f"{angle:.1f}".replace('.', '_')
+            angle_targets.append((angle, os.path.join(args.output_dir, f"angle_{angle_str_safe}"), f"{args.output_name}_angle_{angle_str_safe}"))
+        prepare_scene(args.input, args.render_style, args.output_format, args.pixel_resolution, args.upscale_resolution)
+        render_prepared_angles(angle_targets, args.num_frames, args.output_format, args.upscale_resolution)
+    else:
+        render_animation(args.input, args.output_dir, args.output_name, args.num_frames, args.angle, args.render_style, args.output_format, args.pixel_resolution, args.upscale_resolution) 
\ No newline at end of file
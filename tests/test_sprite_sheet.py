@@ -0,0 +1,73 @@
+import json
+import os
+import sys
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app
+
+
+def write_frames(folder, names, size=64):
+    for name in names:
+        Image.new('RGBA', (size, size), (200, 50, 0, 255)).save(os.path.join(folder, f"{name}.png"))
+
+
+def test_single_frame_angles_wrap_into_near_square_grid(tmp_path):
+    # Auto-angle renders: 16 angles with one frame each
+    names = [f"job_angle_{angle * 22.5:.1f}".replace('.', '_') + "_0000" for angle in range(16)]
+    write_frames(tmp_path, names)
+    sheet_path = tmp_path / "sheet.png"
+    map_path = tmp_path / "sheet.json"
+
+    assert app.create_sprite_sheet(str(tmp_path), str(sheet_path), "job_angle", "png", "PNG", str(map_path))
+
+    with Image.open(sheet_path) as sheet:
+        assert sheet.size == (256, 256)
+    frame_map = json.loads(map_path.read_text())
+    assert sorted(frame_map) == sorted(names)
+    assert len({tuple(rect) for rect in frame_map.values()}) == 16
+
+
+def test_uneven_frame_count_stays_near_square(tmp_path):
+    names = [f"job_angle_{angle}_0_0000" for angle in range(5)]
+    write_frames(tmp_path, names, size=32)
+    sheet_path = tmp_path / "sheet.png"
+
+    assert app.create_sprite_sheet(str(tmp_path), str(sheet_path), "job_angle", "png", "PNG")
+
+    with Image.open(sheet_path) as sheet:
+        assert sheet.size == (96, 64) # 3 columns x 2 rows, last row partly empty
+
+
+def test_multi_frame_animations_keep_one_row_each(tmp_path):
+    names = [f"job_angle_{angle}_0_{frame:04d}" for angle in (0, 45) for frame in range(4)]
+    write_frames(tmp_path, names, size=16)
+    sheet_path = tmp_path / "sheet.png"
+
+    assert app.create_sprite_sheet(str(tmp_path), str(sheet_path), "job_angle", "png", "PNG")
+
+    with Image.open(sheet_path) as sheet:
+        assert sheet.size == (64, 32)
+
+
+def test_angles_fill_cells_in_numeric_angle_order(tmp_path):
+    # Each angle gets its own color, so the sheet's pixels show which angle landed in which cell
+    angles = [angle * 22.5 for angle in range(16)]
+    names = [f"job_angle_{angle:.1f}".replace('.', '_') + "_0000" for angle in angles]
+    for index, name in enumerate(names):
+        Image.new('RGBA', (8, 8), (index * 10, 0, 0, 255)).save(tmp_path / f"{name}.png")
+    sheet_path = tmp_path / "sheet.png"
+    map_path = tmp_path / "sheet.json"
+
+    assert app.create_sprite_sheet(str(tmp_path), str(sheet_path), "job_angle", "png", "PNG", str(map_path))
+
+    frame_map = json.loads(map_path.read_text())
+    # 4x4 grid, left to right then top to bottom: 45 degrees is the third cell, 135 the seventh (not before 45)
+    assert frame_map["job_angle_45_0_0000"] == [16, 0, 8, 8]
+    assert frame_map["job_angle_135_0_0000"] == [16, 8, 8, 8]
+    assert frame_map["job_angle_337_5_0000"] == [24, 24, 8, 8]
+    with Image.open(sheet_path) as sheet:
+        for index in range(16):
+            row, col = divmod(index, 4)
+            assert sheet.getpixel((col * 8 + 4, row * 8 + 4)) == (index * 10, 0, 0, 255)